@@ -1,5 +1,5 @@
 // Device plugin
-import { get_user_devices, add_device, remove_device } from "../utils/db.ts";
+import { get_user_devices, add_device, remove_device, get_device_credential_from_UUID } from "../utils/db.ts";
 import { verify_exists, verify_jwt } from "../auth/auth.ts";
 
 const devices_plugin = async (fastify: any, opts: any) => {
@@ -61,8 +61,16 @@ const devices_plugin = async (fastify: any, opts: any) => {
         return reply.send({ ok: true, device_id: (request as any).device_id });
     });
 
+    // Devices poll this until they are claimed, so read the row fresh rather than
+    // returning the cached copy used for signature checks
     fastify.get("/devices/info", { preHandler: verify_exists }, async (request: any, reply: any) => {
-        return reply.send({ ok: true, device_credentials: (request as any).device_credentials });
+        try {
+            const device_credentials = await get_device_credential_from_UUID((request as any).device_id);
+            return reply.send({ ok: true, device_credentials });
+        } catch (error) {
+            fastify.log.error({ err: error }, "Device info error");
+            return reply.status(500).send({ error: "Failed to fetch device info" });
+        }
     });
 };
 export default devices_plugin;
\ No newline at end of file
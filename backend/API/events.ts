@@ -1,42 +1,204 @@
 // events.ts
 import { verify_exists, verify_jwt } from "../auth/auth.ts";
-import { add_event, fetch_events } from "../utils/db.ts";
-import type { FastifyPluginAsync } from "fastify";
+import { add_events, fetch_events, fetch_event_counts, user_owns_device, EVENT_COUNT_BUCKETS } from "../utils/db.ts";
+import type { EventQuery } from "../utils/db.ts";
+import { event_stream } from "../utils/event_stream.ts";
+import { IngestBuffer } from "../utils/ingest_buffer.ts";
+import type { FastifyPluginAsync, FastifyReply, FastifyRequest } from "fastify";
+
+const STREAM_HEARTBEAT_MS = 15_000;
+const MAX_EVENTS_PER_UPLOAD = 500;
+
+// Device events are acknowledged once queued and written in bulk
+const ingest_buffer = new IngestBuffer({
+    insert_batch: add_events,
+    on_flushed: (rows) => rows.forEach((row) => event_stream.publish(row.device_id, row)),
+    max_batch: Number(process.env.INGEST_MAX_BATCH || 500),
+    flush_interval_ms: Number(process.env.INGEST_FLUSH_INTERVAL_MS || 250),
+    max_pending: Number(process.env.INGEST_MAX_PENDING || 10_000),
+});
+
+// Optional ISO timestamp query/body values; anything else is rejected with a 400
+function is_timestamp(value: unknown): value is string {
+    return typeof value === "string" && !Number.isNaN(Date.parse(value));
+}
+
+function invalid_range(since: unknown, until: unknown): string | null {
+    if (since !== undefined && !is_timestamp(since)) return "since must be an ISO timestamp";
+    if (until !== undefined && !is_timestamp(until)) return "until must be an ISO timestamp";
+    return null;
+}
+
+// Rows are inserted in shared batches, so reject anything Postgres would refuse up front
+function invalid_event(event: any): string | null {
+    if (!event || typeof event.event_type !== "string" || !event.event_type) return "event_type must be a non-empty string";
+    if (!is_timestamp(event.created_at)) return "created_at must be an ISO timestamp";
+    return null;
+}
+
+// Runs after verify_jwt: the :device_id in the route must belong to the logged-in user
+async function verify_device_owner(req: FastifyRequest, reply: FastifyReply) {
+    const device_id = (req.params as any).device_id;
+    const user_id = (req as any).user?.id;
+    try {
+        if (!device_id || !user_id || !(await user_owns_device(device_id, user_id))) {
+            return reply.status(404).send({ error: "Device not found" });
+        }
+    } catch (error) {
+        return reply.status(500).send({ error: `Failed to verify device: ${error}` });
+    }
+}
 
 const events_plugin: FastifyPluginAsync = async (fastify, opts) => {
+    // flush queued events before the server goes away
+    fastify.addHook("onClose", async () => {
+        await ingest_buffer.close();
+    });
+
     // Devices send events here
     fastify.post("/events/add_event", { preHandler: verify_exists }, async (req, reply) => {
         const device_uuid = (req as any).device_id;
         const { event_type, created_at, details } = req.body as any;
-        console.log("Received event:", { device_uuid, event_type, created_at, details });
-        if (!event_type || !created_at) {
-            return reply.status(400).send({ error: "Missing event_type or created_at" });
+        const event_error = invalid_event(req.body);
+        if (event_error) {
+            return reply.status(400).send({ error: event_error });
+        }
+
+        const queued = ingest_buffer.enqueue({ device_id: device_uuid, event_type, created_at, details });
+        if (!queued) {
+            reply.header("Retry-After", String(ingest_buffer.retry_after_sec()));
+            return reply.status(503).send({ error: "Event ingest is busy, retry later" });
+        }
+        return reply.status(202).send({ status: "event queued" });
+    });
+
+    // Devices upload many events at once here (e.g. batch analysis of recordings)
+    fastify.post("/events/add_events", { preHandler: verify_exists }, async (req, reply) => {
+        const device_uuid = (req as any).device_id;
+        const { events } = req.body as any;
+        if (!Array.isArray(events) || events.length === 0) {
+            return reply.status(400).send({ error: "events must be a non-empty array" });
+        }
+        if (events.length > MAX_EVENTS_PER_UPLOAD) {
+            return reply.status(400).send({ error: `At most ${MAX_EVENTS_PER_UPLOAD} events per request` });
+        }
+        for (let i = 0; i < events.length; i++) {
+            const event_error = invalid_event(events[i]);
+            if (event_error) {
+                return reply.status(400).send({ error: `events[${i}]: ${event_error}` });
+            }
+        }
+
+        // all or nothing, so a retried upload does not duplicate a partial batch
+        if (!ingest_buffer.has_room(events.length)) {
+            reply.header("Retry-After", String(ingest_buffer.retry_after_sec()));
+            return reply.status(503).send({ error: "Event ingest is busy, retry later" });
+        }
+        for (const { event_type, created_at, details } of events) {
+            ingest_buffer.enqueue({ device_id: device_uuid, event_type, created_at, details });
+        }
+        return reply.status(202).send({ status: "events queued", count: events.length });
+    });
+
+    // Get a page of events for a device, newest first
+    fastify.get("/devices/events/:device_id", { preHandler: [verify_jwt, verify_device_owner] }, async (req, reply) => {
+        const device_id = (req.params as any).device_id;
+        const { limit, cursor, since, until, event_type } = req.query as any;
+
+        if (!device_id) {
+            return reply.status(400).send({ error: "No device_id provided" });
+        }
+        if (limit !== undefined && !(Number(limit) > 0)) {
+            return reply.status(400).send({ error: "limit must be a positive number" });
+        }
+        const range_error = invalid_range(since, until);
+        if (range_error) {
+            return reply.status(400).send({ error: range_error });
+        }
+        if ((cursor !== undefined && typeof cursor !== "string") || (event_type !== undefined && typeof event_type !== "string")) {
+            return reply.status(400).send({ error: "cursor and event_type must be single values" });
         }
 
+        const query: EventQuery = { cursor, since, until, event_type };
+        if (limit !== undefined) query.limit = Number(limit);
         try {
-            await add_event(device_uuid, event_type, created_at, details);
-        } catch (error :any) {
-            return reply.status(500).send({ error: `Failed to add event: ${error.message}` });
+            const page = await fetch_events(device_id, query);
+            return reply.send(page);
+        } catch (error: any) {
+            if (error.message === "Invalid cursor") {
+                return reply.status(400).send({ error: "Invalid cursor" });
+            }
+            return reply.status(500).send({ error: `Failed to fetch events: ${error}` });
         }
-        return reply.send({ status: "event added" });
     });
 
-    // Get events for a device
-    fastify.get("/devices/events/:device_id", { preHandler: verify_jwt }, async (req, reply) => {
+    // Event counts per type per time bucket for a device
+    fastify.get("/devices/events/:device_id/counts", { preHandler: [verify_jwt, verify_device_owner] }, async (req, reply) => {
         const device_id = (req.params as any).device_id;
-        
+        const { bucket = "hour", since, until } = req.query as any;
+
         if (!device_id) {
             return reply.status(400).send({ error: "No device_id provided" });
         }
+        if (!EVENT_COUNT_BUCKETS.includes(bucket)) {
+            return reply.status(400).send({ error: `bucket must be one of ${EVENT_COUNT_BUCKETS.join(", ")}` });
+        }
+        const range_error = invalid_range(since, until);
+        if (range_error) {
+            return reply.status(400).send({ error: range_error });
+        }
 
         try {
-            const events = await fetch_events(device_id);
-            console.log("Events fetched:", events);
-            return reply.send({ events });
+            const counts = await fetch_event_counts(device_id, bucket, since, until);
+            return reply.send({ bucket, counts });
         } catch (error) {
-            return reply.status(500).send({ error: `Failed to fetch events: ${error}` });
+            return reply.status(500).send({ error: `Failed to fetch event counts: ${error}` });
         }
     });
+
+    // Server-sent events: push newly ingested events for a device.
+    // Clients resume with the Last-Event-ID header (EventSource) or the
+    // last_event_id query parameter (fetch-based readers); a "reset" event tells
+    // them the gap is too old to replay and they should reload a page instead.
+    // Events are fanned out in-process (see event_stream.ts): one backend instance only.
+    fastify.get("/devices/events/:device_id/stream", { preHandler: [verify_jwt, verify_device_owner] }, async (req, reply) => {
+        const device_id = (req.params as any).device_id;
+        if (!device_id) {
+            return reply.status(400).send({ error: "No device_id provided" });
+        }
+        const last_event_id = (req.headers["last-event-id"] as string) || (req.query as any).last_event_id || "";
+
+        reply.hijack();
+        const res = reply.raw;
+        res.writeHead(200, {
+            ...(reply.getHeaders() as any),
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        });
+
+        const write_event = (event: any) => {
+            res.write(`id: ${event.id}\nevent: event\ndata: ${JSON.stringify(event)}\n\n`);
+        };
+
+        if (last_event_id) {
+            const missed = event_stream.replay_since(device_id, last_event_id);
+            if (missed === null) {
+                res.write("event: reset\ndata: {}\n\n");
+            } else {
+                missed.forEach(write_event);
+            }
+        }
+
+        const unsubscribe = event_stream.subscribe(device_id, write_event);
+        const heartbeat = setInterval(() => res.write(": ping\n\n"), STREAM_HEARTBEAT_MS);
+        req.raw.on("close", () => {
+            clearInterval(heartbeat);
+            unsubscribe();
+        });
+    });
 };
 
+export { ingest_buffer };
 export default events_plugin;
\ No newline at end of file
@@ -1,19 +1,49 @@
 import type { FastifyRequest, FastifyReply } from "fastify";
 import { get_device_credential_from_UUID, getSupabaseClient, verify_device_action } from "../utils/db.ts";
 import { verify_signature } from "../utils/crypto.ts";
+import { device_credential_cache } from "../utils/cache.ts";
+import { LatencyTracker } from "../utils/metrics.ts";
 import jwt from "jsonwebtoken";
 
 const supabase = getSupabaseClient();
 
 const JWT_Secret = process.env.JWT_SECRET || "";
 
+const device_auth_latency = new LatencyTracker();
+
+// PostgREST error code returned by .single() when no row matches
+const NO_ROWS_ERROR = "PGRST116";
+
+async function lookup_device_credential(device_uuid: string) {
+  const cached = device_credential_cache.get(device_uuid);
+  if (cached !== undefined) {
+    return cached;
+  }
+  try {
+    const device_credentials = await get_device_credential_from_UUID(device_uuid);
+    if (!device_credentials) {
+      device_credential_cache.set_missing(device_uuid);
+      return null;
+    }
+    device_credential_cache.set(device_uuid, device_credentials);
+    return device_credentials;
+  } catch (err) {
+    // only cache "does not exist"; transient DB errors must not lock a device out
+    if ((err as any)?.code === NO_ROWS_ERROR) {
+      device_credential_cache.set_missing(device_uuid);
+      return null;
+    }
+    throw err;
+  }
+}
+
 async function get_device_credentials_from_headers(req: FastifyRequest, reply: FastifyReply) {
   // fall back to headers with signature verification
   const device_uuid = (req.headers["x-device-id"] as string) || "";
   if (!device_uuid) {
     throw new Error("No device ID provided");
   }
-  const device_credentials = await get_device_credential_from_UUID(device_uuid)
+  const device_credentials = await lookup_device_credential(device_uuid);
   if (!device_credentials) {
     throw new Error("No device ID credentials found");
   }
@@ -25,11 +55,10 @@ async function get_device_credentials_from_headers(req: FastifyRequest, reply: F
   const sig = (req.headers["x-signature"] as string) || "";
   const ts = (req.headers["x-ts"] as string) || "";
   const method = req.method || "POST";
-  
-  const rawBody = req.body && Object.keys(req.body).length > 0
-  ? JSON.stringify(req.body)
-  : "{}";
-  
+
+  // verify against the exact bytes the device signed (kept by the JSON parser in index.ts)
+  const rawBody = (req as any).rawBody || "{}";
+
   if (!verify_signature(method, ts, rawBody, sig, apiKey)) {
     throw new Error("Invalid signature");
   }
@@ -75,12 +104,21 @@ async function verify_exists(req: FastifyRequest, reply: FastifyReply) {
   }
 
   // verify device credentials
+  const done = device_auth_latency.start();
   try {
-    console.log("Verifying device credentials via verify_exists");
     await get_device_credentials_from_headers(req, reply);
   } catch (err) {
     return reply.status(401).send({ error: "Error verifying device: " + (err as any).message });
+  } finally {
+    done();
   }
 }
 
-export { verify_jwt, verify_exists };
\ No newline at end of file
+function device_auth_metrics() {
+  return {
+    credential_cache: device_credential_cache.stats(),
+    latency: device_auth_latency.summary(),
+  };
+}
+
+export { verify_jwt, verify_exists, device_auth_metrics };
\ No newline at end of file
@@ -2,15 +2,31 @@ import Fastify from "fastify";
 import fastifyCors from "@fastify/cors";
 import fastifyCookie from "@fastify/cookie";
 import auth_plugin from "./auth/authPlugin.ts"; // import the plugin
-import events_plugin from "./API/events.ts"; // import the plugin
+import events_plugin, { ingest_buffer } from "./API/events.ts"; // import the plugin
 import devices_plugin from "./API/devices.ts";
 import helmet from "@fastify/helmet";
 import fastifyRateLimit from "@fastify/rate-limit";
 import 'dotenv/config';
 import faces_plugin from "./API/faces.ts";
+import { device_auth_metrics } from "./auth/auth.ts";
 
 const app = Fastify({ logger: true });
 
+// Operational metrics are served on a separate listener bound to loopback by
+// default, so cache and queue internals are not exposed on the public port
+const METRICS_HOST = process.env.METRICS_HOST || "127.0.0.1";
+const METRICS_PORT = Number(process.env.METRICS_PORT || 9100);
+const metrics_app = Fastify({ logger: false });
+
+// keep the raw JSON body so device signatures are checked against the signed bytes;
+// parsing still goes through Fastify's parser for its __proto__/constructor poisoning checks
+const default_json_parser = app.getDefaultJsonParser("error", "error");
+app.addContentTypeParser("application/json", { parseAs: "string" }, (req, body, done) => {
+  (req as any).rawBody = body;
+  if (!body) return done(null, {});
+  default_json_parser(req, body as string, done);
+});
+
 const allowedOrigins = [
   process.env.NEXT_PUBLIC_FRONTEND_URL || "http://localhost:3000",
   process.env.NEXT_PUBLIC_DEVICE_URL || "http://localhost:5000", 
@@ -26,7 +42,7 @@ await app.register(fastifyCors, {
   },
   credentials: true,
   methods: ["GET", "POST", "PUT", "DELETE"],
-  allowedHeaders: ["Content-Type", "Authorization", "x-device-id", "x-ts", "x-signature"],
+  allowedHeaders: ["Content-Type", "Authorization", "x-device-id", "x-ts", "x-signature", "Last-Event-ID"],
 });
 
 // cookies (for refresh token)
@@ -54,10 +70,29 @@ console.log("Routes:\n", app.printRoutes());
 // -------------------------
 app.get("/", async () => ({ status: "online" }));
 
+// Device auth path: credential cache hit rate and preHandler latency
+metrics_app.get("/metrics/auth", async () => device_auth_metrics());
+
+// Event ingest buffer: queue depth, bulk insert counts and flush latency
+metrics_app.get("/metrics/ingest", async () => ingest_buffer.stats());
+
+// close the app on shutdown so plugins can flush (e.g. the event ingest buffer)
+for (const signal of ["SIGINT", "SIGTERM"] as const) {
+  process.once(signal, async () => {
+    try {
+      await Promise.all([app.close(), metrics_app.close()]);
+    } finally {
+      process.exit(0);
+    }
+  });
+}
+
 // Start
 try {
   await app.listen({ port: 8000 });
   console.log("Backend running on port 8000");
+  await metrics_app.listen({ host: METRICS_HOST, port: METRICS_PORT });
+  console.log(`Metrics available on http://${METRICS_HOST}:${METRICS_PORT}/metrics/*`);
 } catch (err) {
   app.log.error(err);
   process.exit(1);
@@ -0,0 +1,56 @@
+// cache.test.ts
+// Run with: npm test
+import { test } from "node:test";
+import assert from "node:assert/strict";
+import { TtlCache } from "./cache.ts";
+
+test("get returns cached values and counts hits and misses", () => {
+    const cache = new TtlCache<string>(60_000, 60_000, 10);
+    assert.equal(cache.get("a"), undefined);
+    cache.set("a", "key-a");
+    assert.equal(cache.get("a"), "key-a");
+    const stats = cache.stats();
+    assert.equal(stats.hits, 1);
+    assert.equal(stats.misses, 1);
+    assert.equal(stats.hit_rate, 0.5);
+});
+
+test("expired entries are misses", () => {
+    const cache = new TtlCache<string>(0, 0, 10);
+    cache.set("a", "key-a");
+    cache.set_missing("b");
+    assert.equal(cache.get("a"), undefined);
+    assert.equal(cache.get("b"), undefined);
+    assert.equal(cache.stats().size, 0);
+});
+
+test("negative entries return null and use their own ttl", () => {
+    const cache = new TtlCache<string>(0, 60_000, 10);
+    cache.set_missing("gone");
+    assert.equal(cache.get("gone"), null);
+    assert.equal(cache.stats().negative_hits, 1);
+});
+
+test("the least recently used entry is evicted first", () => {
+    const cache = new TtlCache<string>(60_000, 60_000, 2);
+    cache.set("a", "1");
+    cache.set("b", "2");
+    cache.get("a"); // a is now more recent than b
+    cache.set("c", "3");
+    assert.equal(cache.get("b"), undefined);
+    assert.equal(cache.get("a"), "1");
+    assert.equal(cache.get("c"), "3");
+    assert.equal(cache.stats().evictions, 1);
+});
+
+test("invalidate and clear drop entries", () => {
+    const cache = new TtlCache<string>(60_000, 60_000, 10);
+    cache.set("a", "1");
+    cache.set_missing("b");
+    cache.invalidate("a");
+    cache.invalidate("missing-key");
+    assert.equal(cache.get("a"), undefined);
+    cache.clear();
+    assert.equal(cache.get("b"), undefined);
+    assert.equal(cache.stats().invalidations, 2);
+});
@@ -0,0 +1,96 @@
+// cache.ts
+// Small in-process TTL cache used on the device auth path.
+
+type CacheEntry<V> = {
+    value: V | null;     // null marks a negative (known-missing) entry
+    expires_at: number;
+};
+
+export class TtlCache<V> {
+    private entries = new Map<string, CacheEntry<V>>();
+    private hits = 0;
+    private negative_hits = 0;
+    private misses = 0;
+    private evictions = 0;
+    private invalidations = 0;
+
+    constructor(
+        private ttl_ms: number,
+        private negative_ttl_ms: number,
+        private max_entries: number,
+    ) {}
+
+    // Returns undefined on a miss, null on a negative hit, the value otherwise.
+    get(key: string): V | null | undefined {
+        const entry = this.entries.get(key);
+        if (!entry) {
+            this.misses++;
+            return undefined;
+        }
+        if (entry.expires_at <= Date.now()) {
+            this.entries.delete(key);
+            this.misses++;
+            return undefined;
+        }
+        // refresh recency so eviction drops the least recently used key
+        this.entries.delete(key);
+        this.entries.set(key, entry);
+        if (entry.value === null) {
+            this.negative_hits++;
+        } else {
+            this.hits++;
+        }
+        return entry.value;
+    }
+
+    set(key: string, value: V) {
+        this.put(key, { value, expires_at: Date.now() + this.ttl_ms });
+    }
+
+    set_missing(key: string) {
+        this.put(key, { value: null, expires_at: Date.now() + this.negative_ttl_ms });
+    }
+
+    invalidate(key: string) {
+        if (this.entries.delete(key)) {
+            this.invalidations++;
+        }
+    }
+
+    clear() {
+        this.invalidations += this.entries.size;
+        this.entries.clear();
+    }
+
+    stats() {
+        const lookups = this.hits + this.negative_hits + this.misses;
+        return {
+            size: this.entries.size,
+            hits: this.hits,
+            negative_hits: this.negative_hits,
+            misses: this.misses,
+            evictions: this.evictions,
+            invalidations: this.invalidations,
+            hit_rate: lookups > 0 ? (this.hits + this.negative_hits) / lookups : 0,
+        };
+    }
+
+    private put(key: string, entry: CacheEntry<V>) {
+        this.entries.delete(key);
+        this.entries.set(key, entry);
+        while (this.entries.size > this.max_entries) {
+            const oldest = this.entries.keys().next().value;
+            if (oldest === undefined) break;
+            this.entries.delete(oldest);
+            this.evictions++;
+        }
+    }
+}
+
+// Device credentials keyed by device_uuid. Shared by the auth preHandler
+// (reads) and db.ts (invalidation when a device is removed or re-keyed).
+export const device_credential_cache = new TtlCache<any>(
+    Number(process.env.DEVICE_CRED_CACHE_TTL_MS || 60_000),
+    Number(process.env.DEVICE_CRED_CACHE_NEGATIVE_TTL_MS || 10_000),
+    Number(process.env.DEVICE_CRED_CACHE_MAX_ENTRIES || 10_000),
+);
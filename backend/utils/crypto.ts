@@ -8,16 +8,15 @@ export function verify_signature(method: string, ts: string, body: any, signatur
   if (!signature || !ts || !apiKey || !method) return false;
 
   const msg = `${method}\n${ts}\n${body}`;
-  console.log("NODE MESSAGE:", JSON.stringify(msg));
   const expectedSig = crypto
     .createHmac("sha256", apiKey)
     .update(msg)
     .digest("hex");
 
-  return crypto.timingSafeEqual(
-    Buffer.from(signature, "hex"),
-    Buffer.from(expectedSig, "hex")
-  );
+  const given = Buffer.from(signature, "hex");
+  const expected = Buffer.from(expectedSig, "hex");
+  if (given.length !== expected.length) return false;
+  return crypto.timingSafeEqual(given, expected);
 }
 
 export function encryptFaceEncoding(plainNums: number[]): string {
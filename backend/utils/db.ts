@@ -2,6 +2,8 @@
 import { createClient, SupabaseClient } from "@supabase/supabase-js";
 import 'dotenv/config';
 import { encryptFaceEncoding, decryptFaceEncoding, hashDeviceKey } from "./crypto.ts";
+import { device_credential_cache } from "./cache.ts";
+import { encode_event_cursor, decode_event_cursor } from "./event_cursor.ts";
 
 const supabase = createClient(
   process.env.SUPABASE_URL!,
@@ -47,6 +49,8 @@ export async function add_device(userId: string, deviceId: string, deviceName: s
         .from("devices")
         .insert({ user_id: userId, device_uuid: deviceId, name: deviceName })
     if (error) throw new Error("UPDATE ERROR:" + error.message);
+    // claiming changes the device's credential row (user_id, claimed)
+    device_credential_cache.invalidate(deviceId);
     return data;
 }
 
@@ -63,6 +67,7 @@ export async function remove_device(deviceId: string, userId: string) {
         .eq("device_uuid", deviceId)
         .eq("user_id", userId);
     if (error) throw error;
+    device_credential_cache.invalidate(deviceId);
     return data;
 }
 
@@ -70,24 +75,83 @@ export async function add_event(device_uuid: string, eventType: string, created_
     if (!device_uuid) {
         throw new Error("No device UUID provided");
     }
-    const { error } = await supabase
+    const { data, error } = await supabase
         .from("events")
         .insert({ device_id: device_uuid, event_type: eventType, created_at: created_at, details: details })
+        .select()
         .single();
     if (error) throw error;
+    return data;
+}
+
+export async function add_events(rows: { device_id: string; event_type: string; created_at: string; details: any }[]) {
+    if (rows.length === 0) return [];
+    const { data, error } = await supabase
+        .from("events")
+        .insert(rows)
+        .select();
+    if (error) throw error;
+    return data;
 }
 
-export async function fetch_events(deviceId: string) {
-    
+export type EventQuery = {
+    limit?: number;
+    cursor?: string;      // opaque cursor returned as next_cursor by a previous page
+    since?: string;       // inclusive lower bound on created_at
+    until?: string;       // exclusive upper bound on created_at
+    event_type?: string;
+};
+
+export const EVENTS_PAGE_DEFAULT = 50;
+export const EVENTS_PAGE_MAX = 200;
+
+export async function fetch_events(deviceId: string, query: EventQuery = {}) {
     if (!deviceId) {
         throw new Error("No device ID provided");
     }
-    console.log("Fetching events for device ID in DB:", deviceId);
-    const { data, error } = await supabase
+    const limit = Math.min(Math.max(Math.trunc(query.limit || EVENTS_PAGE_DEFAULT), 1), EVENTS_PAGE_MAX);
+
+    let request = supabase
         .from("events")
         .select("*")
-        .eq("device_id", deviceId)
-        .order("created_at", { ascending: false });
+        .eq("device_id", deviceId);
+    if (query.event_type) request = request.eq("event_type", query.event_type);
+    if (query.since) request = request.gte("created_at", query.since);
+    if (query.until) request = request.lt("created_at", query.until);
+    if (query.cursor) {
+        const [created_at, id] = decode_event_cursor(query.cursor);
+        request = request.or(`created_at.lt."${created_at}",and(created_at.eq."${created_at}",id.lt.${id})`);
+    }
+
+    // fetch one extra row to know whether another page exists
+    const { data, error } = await request
+        .order("created_at", { ascending: false })
+        .order("id", { ascending: false })
+        .limit(limit + 1);
+    if (error) throw error;
+
+    const events = data.slice(0, limit);
+    const last = events[events.length - 1];
+    const next_cursor = data.length > limit && last ? encode_event_cursor(last.created_at, last.id) : null;
+    return { events, next_cursor };
+}
+
+export const EVENT_COUNT_BUCKETS = ["minute", "hour", "day", "week"];
+
+export async function fetch_event_counts(deviceId: string, bucket: string, since?: string, until?: string) {
+    if (!deviceId) {
+        throw new Error("No device ID provided");
+    }
+    if (!EVENT_COUNT_BUCKETS.includes(bucket)) {
+        throw new Error("Invalid bucket");
+    }
+    // aggregated in Postgres by the event_counts() function in db/seed.sql
+    const { data, error } = await supabase.rpc("event_counts", {
+        p_device_id: deviceId,
+        p_bucket: bucket,
+        p_since: since ?? null,
+        p_until: until ?? null,
+    });
     if (error) throw error;
     return data;
 }
@@ -221,6 +285,23 @@ export async function delete_pending_profile(emailOrPhone: string) {
     return data;
 }
 
+export async function user_owns_device(deviceUUID: string, userId: string) {
+    if (!deviceUUID) {
+        throw new Error("No device UUID provided");
+    }
+    if (!userId) {
+        throw new Error("No user ID provided");
+    }
+    const { data, error } = await supabase
+        .from("devices")
+        .select("id")
+        .eq("device_uuid", deviceUUID)
+        .eq("user_id", userId)
+        .maybeSingle();
+    if (error) throw error;
+    return !!data;
+}
+
 export async function verify_device_action(deviceId: string, userId: string) {
     if (!deviceId) {
         throw new Error("No device ID provided");
@@ -290,6 +371,8 @@ export async function create_device_credential(deviceId: string, apiKey: string)
         })
         .single();
     if (error) throw error;
+    // re-keyed devices must not keep authenticating with the old key
+    device_credential_cache.invalidate(deviceId);
     return data;
 }
 
@@ -302,6 +385,7 @@ export async function delete_device_credential(deviceId: string) {
         .delete()
         .eq("device_uuid", deviceId);
     if (error) throw error;
+    device_credential_cache.invalidate(deviceId);
     return data;
 }
 
@@ -0,0 +1,35 @@
+// event_cursor.test.ts
+// Run with: npm test
+import { test } from "node:test";
+import assert from "node:assert/strict";
+import { encode_event_cursor, decode_event_cursor } from "./event_cursor.ts";
+
+const ID = "3f2b8c1e-9d4a-4e6b-8f0a-1c2d3e4f5a6b";
+
+function raw_cursor(value: unknown): string {
+    return Buffer.from(JSON.stringify(value)).toString("base64url");
+}
+
+test("a cursor round-trips created_at and id", () => {
+    const created_at = "2025-01-02T03:04:05.678+00:00";
+    assert.deepEqual(decode_event_cursor(encode_event_cursor(created_at, ID)), [created_at, ID]);
+});
+
+test("malformed cursors are rejected", () => {
+    for (const cursor of ["", "not-base64-json", raw_cursor("x"), raw_cursor([]), raw_cursor([123, ID])]) {
+        assert.throws(() => decode_event_cursor(cursor), /Invalid cursor/);
+    }
+});
+
+test("cursors that would inject PostgREST filters are rejected", () => {
+    const now = "2025-01-02T03:04:05Z";
+    const injected = [
+        raw_cursor([now, "1),user_id.neq.(0"]),
+        raw_cursor([`${now}",device_id.neq."x`, ID]),
+        raw_cursor([`${now})`, ID]),
+        raw_cursor(["not a date", ID]),
+    ];
+    for (const cursor of injected) {
+        assert.throws(() => decode_event_cursor(cursor), /Invalid cursor/);
+    }
+});
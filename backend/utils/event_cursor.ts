@@ -0,0 +1,20 @@
+// event_cursor.ts
+// Opaque cursors for paging events newest first.
+
+// Cursors are the (created_at, id) of the last row of a page, so paging is a
+// keyset seek on idx_events_device_created_id rather than an OFFSET scan.
+export function encode_event_cursor(created_at: string, id: string): string {
+    return Buffer.from(JSON.stringify([created_at, id])).toString("base64url");
+}
+
+export function decode_event_cursor(cursor: string): [string, string] {
+    try {
+        const [created_at, id] = JSON.parse(Buffer.from(cursor, "base64url").toString());
+        // both values are spliced into a PostgREST filter, so only accept well-formed ones
+        if (typeof created_at === "string" && !Number.isNaN(Date.parse(created_at)) && !/[",()]/.test(created_at)
+            && typeof id === "string" && /^[0-9a-f-]{36}$/i.test(id)) {
+            return [created_at, id];
+        }
+    } catch {}
+    throw new Error("Invalid cursor");
+}
@@ -0,0 +1,62 @@
+// event_stream.ts
+// In-process fan-out of newly ingested events to connected dashboard streams.
+// Each backend instance only sees the events it ingested itself, so live
+// streams are only supported with a single backend instance. Running several
+// would need a shared channel (Postgres LISTEN/NOTIFY or Supabase Realtime).
+
+type Listener = (event: any) => void;
+
+const RECENT_PER_DEVICE = Number(process.env.EVENT_STREAM_REPLAY_SIZE || 200);
+
+class EventStream {
+    private listeners = new Map<string, Set<Listener>>();
+    private recent = new Map<string, any[]>();
+
+    publish(device_id: string, event: any) {
+        let ring = this.recent.get(device_id);
+        if (!ring) {
+            ring = [];
+            this.recent.set(device_id, ring);
+        }
+        ring.push(event);
+        if (ring.length > RECENT_PER_DEVICE) ring.shift();
+
+        for (const listener of this.listeners.get(device_id) ?? []) {
+            try {
+                listener(event);
+            } catch (err) {
+                console.log("Event stream listener error:", err);
+            }
+        }
+    }
+
+    subscribe(device_id: string, listener: Listener): () => void {
+        let set = this.listeners.get(device_id);
+        if (!set) {
+            set = new Set();
+            this.listeners.set(device_id, set);
+        }
+        set.add(listener);
+        return () => {
+            set.delete(listener);
+            if (set.size === 0) this.listeners.delete(device_id);
+        };
+    }
+
+    // Events published after last_event_id, or null if it has fallen out of
+    // the replay buffer and the client has to reload from the query API.
+    replay_since(device_id: string, last_event_id: string): any[] | null {
+        const ring = this.recent.get(device_id) ?? [];
+        const idx = ring.findIndex((e) => e.id === last_event_id);
+        if (idx === -1) return null;
+        return ring.slice(idx + 1);
+    }
+
+    connections() {
+        let total = 0;
+        for (const set of this.listeners.values()) total += set.size;
+        return total;
+    }
+}
+
+export const event_stream = new EventStream();
@@ -0,0 +1,90 @@
+// ingest_buffer.test.ts
+// Run with: npm test
+import { test } from "node:test";
+import assert from "node:assert/strict";
+import { IngestBuffer } from "./ingest_buffer.ts";
+import type { EventRow } from "./ingest_buffer.ts";
+
+function row(event_type = "audio_trigger", device_id = "device-1"): EventRow {
+    return { device_id, event_type, created_at: new Date().toISOString(), details: {} };
+}
+
+// In-memory stand-in for the events table; rows with event_type "bad" fail
+// like an FK violation, and the first `outages` calls fail like a network error.
+function memory_table(outages = 0) {
+    const rows: EventRow[] = [];
+    let calls = 0;
+    const insert_batch = async (batch: EventRow[]) => {
+        calls++;
+        if (calls <= outages) throw new Error("connection reset");
+        if (batch.some((r) => r.event_type === "bad")) {
+            throw { code: "23503", message: "violates foreign key constraint" };
+        }
+        rows.push(...batch);
+        return batch.map((r, i) => ({ ...r, id: String(rows.length - batch.length + i) }));
+    };
+    return { rows, insert_batch, calls: () => calls };
+}
+
+test("flush writes queued events and reports them", async () => {
+    const table = memory_table();
+    const flushed: any[] = [];
+    const buffer = new IngestBuffer({ insert_batch: table.insert_batch, on_flushed: (r) => flushed.push(...r), flush_interval_ms: 60_000 });
+    assert.equal(buffer.enqueue(row()), true);
+    assert.equal(buffer.enqueue(row()), true);
+    await buffer.flush();
+    assert.equal(table.rows.length, 2);
+    assert.equal(flushed.length, 2);
+    assert.equal(buffer.stats().pending, 0);
+    await buffer.close();
+});
+
+test("enqueue applies backpressure once max_pending is reached", async () => {
+    const table = memory_table();
+    const buffer = new IngestBuffer({ insert_batch: table.insert_batch, max_pending: 2, flush_interval_ms: 60_000 });
+    assert.equal(buffer.enqueue(row()), true);
+    assert.equal(buffer.enqueue(row()), true);
+    assert.equal(buffer.has_room(1), false);
+    assert.equal(buffer.enqueue(row()), false);
+    assert.ok(buffer.retry_after_sec() >= 1);
+    assert.equal(buffer.stats().rejected, 1);
+    await buffer.close();
+    assert.equal(table.rows.length, 2);
+});
+
+test("a bad row is dropped without losing the rest of its batch", async () => {
+    const table = memory_table();
+    const buffer = new IngestBuffer({ insert_batch: table.insert_batch, flush_interval_ms: 60_000 });
+    for (let i = 0; i < 9; i++) buffer.enqueue(row());
+    buffer.enqueue(row("bad", "removed-device"));
+    await buffer.flush();
+    const stats = buffer.stats();
+    assert.equal(table.rows.length, 9);
+    assert.equal(stats.invalid, 1);
+    assert.equal(stats.dropped, 0);
+    assert.equal(stats.pending, 0);
+    await buffer.close();
+});
+
+test("a failed insert is retried without duplicating rows", async () => {
+    const table = memory_table(1);
+    const buffer = new IngestBuffer({ insert_batch: table.insert_batch, flush_interval_ms: 60_000 });
+    buffer.enqueue(row());
+    buffer.enqueue(row());
+    await buffer.flush();
+    assert.equal(table.rows.length, 0);
+    assert.equal(buffer.stats().pending, 2);
+    await buffer.flush();
+    assert.equal(table.rows.length, 2);
+    assert.equal(buffer.stats().failed_flushes, 1);
+    await buffer.close();
+});
+
+test("close drains pending events and refuses new ones", async () => {
+    const table = memory_table();
+    const buffer = new IngestBuffer({ insert_batch: table.insert_batch, max_batch: 2, flush_interval_ms: 60_000 });
+    for (let i = 0; i < 5; i++) buffer.enqueue(row());
+    await buffer.close();
+    assert.equal(table.rows.length, 5);
+    assert.equal(buffer.enqueue(row()), false);
+});
@@ -0,0 +1,206 @@
+// ingest_buffer.ts
+// Write-behind buffer for device events: requests are acknowledged once the
+// event is queued, and queued events are written with bulk inserts.
+
+import { LatencyTracker } from "./metrics.ts";
+
+export type EventRow = {
+    device_id: string;
+    event_type: string;
+    created_at: string;
+    details: any;
+};
+
+type PendingEvent = { row: EventRow; attempts: number };
+
+// Postgres data exceptions (22xxx, e.g. a bad timestamp) and integrity
+// violations (23xxx, e.g. a device_id whose device was removed) are caused by
+// the rows themselves; anything else (network, timeouts) is retried as a batch.
+function is_row_error(err: any): boolean {
+    return /^2[23]/.test(String(err?.code ?? ""));
+}
+
+export type IngestBufferOptions = {
+    // Bulk insert; resolves to the inserted rows. Injected so the buffer can
+    // run against Supabase, a local Postgres or an in-memory stand-in.
+    insert_batch: (rows: EventRow[]) => Promise<any[]>;
+    // Called with the inserted rows after each successful flush.
+    on_flushed?: (rows: any[]) => void;
+    max_batch?: number;
+    flush_interval_ms?: number;
+    max_pending?: number;
+    max_attempts?: number;
+};
+
+export class IngestBuffer {
+    private pending: PendingEvent[] = [];
+    private timer: ReturnType<typeof setTimeout> | null = null;
+    private flushing: Promise<void> | null = null;
+    private closed = false;
+
+    private insert_batch: IngestBufferOptions["insert_batch"];
+    private on_flushed: (rows: any[]) => void;
+    private max_batch: number;
+    private flush_interval_ms: number;
+    private max_pending: number;
+    private max_attempts: number;
+
+    private accepted = 0;
+    private rejected = 0;
+    private inserted = 0;
+    private dropped = 0;
+    private invalid = 0;
+    private failed_flushes = 0;
+    private flush_latency = new LatencyTracker();
+
+    constructor(opts: IngestBufferOptions) {
+        this.insert_batch = opts.insert_batch;
+        this.on_flushed = opts.on_flushed ?? (() => {});
+        this.max_batch = opts.max_batch ?? 500;
+        this.flush_interval_ms = opts.flush_interval_ms ?? 250;
+        this.max_pending = opts.max_pending ?? 10_000;
+        this.max_attempts = opts.max_attempts ?? 5;
+    }
+
+    // Queue an event. Returns false when the buffer is full (or closing) and
+    // the caller should ask the device to retry later.
+    enqueue(row: EventRow): boolean {
+        if (this.closed || this.pending.length >= this.max_pending) {
+            this.rejected++;
+            return false;
+        }
+        this.pending.push({ row, attempts: 0 });
+        this.accepted++;
+        if (this.pending.length >= this.max_batch) {
+            this.schedule(0);
+        } else {
+            this.schedule(this.flush_interval_ms);
+        }
+        return true;
+    }
+
+    // Whether n more events would fit without rejecting any of them.
+    has_room(n: number): boolean {
+        return !this.closed && this.pending.length + n <= this.max_pending;
+    }
+
+    // Suggested Retry-After (seconds) for rejected requests.
+    retry_after_sec(): number {
+        const batches = Math.ceil(this.pending.length / this.max_batch);
+        return Math.max(1, Math.ceil((batches * this.flush_interval_ms) / 1000));
+    }
+
+    async flush(): Promise<void> {
+        // one insert in flight at a time; callers wait for it and then drain the rest
+        while (this.flushing) await this.flushing;
+        if (this.pending.length === 0) return;
+        let ok = false;
+        this.flushing = this.flush_once().then((result) => { ok = result; });
+        try {
+            await this.flushing;
+        } finally {
+            this.flushing = null;
+        }
+        if (this.pending.length > 0 && !this.closed) {
+            // drain full batches immediately, but back off after a failed insert
+            this.schedule(ok && this.pending.length >= this.max_batch ? 0 : this.flush_interval_ms);
+        }
+    }
+
+    // Stop accepting events and write out everything still queued.
+    async close(): Promise<void> {
+        this.closed = true;
+        if (this.timer) {
+            clearTimeout(this.timer);
+            this.timer = null;
+        }
+        while (this.pending.length > 0 || this.flushing) {
+            const before = this.pending.length;
+            await this.flush();
+            if (this.pending.length > 0 && this.pending.length >= before) break; // DB unavailable, give up
+        }
+        if (this.pending.length > 0) {
+            console.log(`Ingest buffer closed with ${this.pending.length} unwritten events`);
+            this.dropped += this.pending.length;
+            this.pending = [];
+        }
+    }
+
+    stats() {
+        return {
+            pending: this.pending.length,
+            max_pending: this.max_pending,
+            accepted: this.accepted,
+            rejected: this.rejected,
+            inserted: this.inserted,
+            dropped: this.dropped,
+            invalid: this.invalid,
+            failed_flushes: this.failed_flushes,
+            flush_latency: this.flush_latency.summary(),
+        };
+    }
+
+    private schedule(delay_ms: number) {
+        if (this.timer) {
+            if (delay_ms > 0) return;
+            clearTimeout(this.timer);
+        }
+        this.timer = setTimeout(() => {
+            this.timer = null;
+            this.flush().catch((err) => console.log("Ingest flush error:", err));
+        }, delay_ms);
+    }
+
+    private async flush_once(): Promise<boolean> {
+        const batch = this.pending.splice(0, this.max_batch);
+        const done = this.flush_latency.start();
+        try {
+            const { rows, retry } = await this.insert_isolating(batch);
+            if (rows.length > 0) {
+                try {
+                    this.on_flushed(rows);
+                } catch (err) {
+                    console.log("Ingest on_flushed callback failed:", err);
+                }
+            }
+            if (retry.length === 0) return true;
+
+            // put retryable events back at the front, within the memory bound
+            const again = retry.filter((b) => ++b.attempts < this.max_attempts);
+            const room = Math.max(0, this.max_pending - this.pending.length);
+            const kept = again.slice(0, room);
+            this.dropped += retry.length - kept.length;
+            this.pending.unshift(...kept);
+            return false;
+        } finally {
+            done();
+        }
+    }
+
+    // Insert a batch. When Postgres rejects it because of its contents, split
+    // it in halves until the offending rows are isolated, so one bad event
+    // does not take the rest of the batch down with it.
+    private async insert_isolating(batch: PendingEvent[]): Promise<{ rows: any[]; retry: PendingEvent[] }> {
+        try {
+            const rows = await this.insert_batch(batch.map((b) => b.row));
+            this.inserted += batch.length;
+            return { rows: rows ?? [], retry: [] };
+        } catch (err) {
+            const message = (err as any)?.message ?? err;
+            if (!is_row_error(err)) {
+                this.failed_flushes++;
+                console.log("Bulk event insert failed:", message);
+                return { rows: [], retry: batch };
+            }
+            if (batch.length === 1) {
+                this.invalid++;
+                console.log(`Dropping event from device ${batch[0]!.row.device_id}:`, message);
+                return { rows: [], retry: [] };
+            }
+            const mid = Math.ceil(batch.length / 2);
+            const left = await this.insert_isolating(batch.slice(0, mid));
+            const right = await this.insert_isolating(batch.slice(mid));
+            return { rows: [...left.rows, ...right.rows], retry: [...left.retry, ...right.retry] };
+        }
+    }
+}
@@ -0,0 +1,39 @@
+// metrics.ts
+// Lightweight latency tracking for backend hot paths.
+
+const SAMPLE_WINDOW = 1024;
+
+export class LatencyTracker {
+    private samples = new Float64Array(SAMPLE_WINDOW);
+    private next = 0;
+    private count = 0;
+    private total_ms = 0;
+    private max_ms = 0;
+
+    record(ms: number) {
+        this.samples[this.next] = ms;
+        this.next = (this.next + 1) % SAMPLE_WINDOW;
+        this.count++;
+        this.total_ms += ms;
+        if (ms > this.max_ms) this.max_ms = ms;
+    }
+
+    // Start a timer; call the returned function when the measured work is done.
+    start(): () => void {
+        const t0 = performance.now();
+        return () => this.record(performance.now() - t0);
+    }
+
+    summary() {
+        const n = Math.min(this.count, SAMPLE_WINDOW);
+        const window = Array.from(this.samples.subarray(0, n)).sort((a, b) => a - b);
+        const pct = (p: number) => (n > 0 ? window[Math.min(n - 1, Math.floor(p * n))] ?? 0 : 0);
+        return {
+            count: this.count,
+            avg_ms: this.count > 0 ? this.total_ms / this.count : 0,
+            p50_ms: pct(0.5),
+            p99_ms: pct(0.99),
+            max_ms: this.max_ms,
+        };
+    }
+}
@@ -74,8 +74,26 @@ create table if not exists events (
 );
 
 create index if not exists idx_events_device_id on events (device_id);
+-- Keyset pagination: newest-first pages per device seek on (created_at, id)
+create index if not exists idx_events_device_created_id on events (device_id, created_at desc, id desc);
 create index if not exists idx_events_user_id on events (user_id);
 
+-- Event counts per type per time bucket (called via supabase.rpc from the backend)
+create or replace function event_counts(
+  p_device_id uuid,
+  p_bucket text default 'hour',
+  p_since timestamptz default null,
+  p_until timestamptz default null
+) returns table (bucket timestamptz, event_type text, count bigint) as $$
+  select date_trunc(p_bucket, e.created_at) as bucket, e.event_type, count(*) as count
+  from events e
+  where e.device_id = p_device_id
+    and (p_since is null or e.created_at >= p_since)
+    and (p_until is null or e.created_at < p_until)
+  group by 1, 2
+  order by 1, 2;
+$$ language sql stable;
+
 -- Face encodings (stored as encrypted text blob)
 create table if not exists face_encodings (
   id uuid primary key default gen_random_uuid(),
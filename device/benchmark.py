@@ -0,0 +1,237 @@
+"""Replays recorded fixtures through the device hot paths and reports throughput, latency and memory.
+
+Stages:
+  video.anomalyDetected         frames from a video file, image or image directory
+  audio.compute_sound_features  blocks from a WAV file
+  audio._evaluate_audio         the same blocks through SoundRecognizer's trigger logic
+  audio.StreamingAnalyzer.push  hop-sized blocks through the overlapping-window analyser
+  sender.sendAudioEvent         signed event POSTs to a local stub backend
+
+No camera, microphone or backend is needed. Without --wav a synthetic fixture is generated.
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from sources import ImageSource, WavFileSource, open_video_source
+
+DEFAULT_FACE_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "brandon.png")
+
+
+def _percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def _measure(name, items, fn):
+    """Call fn on every item from items() twice: once timed, once under tracemalloc.
+
+    Tracing every allocation slows the hot path down, so latency and memory
+    come from separate passes over fresh iterables.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for item in items():
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for item in items():
+        fn(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "stage": name,
+        "count": len(latencies),
+        "throughput_per_sec": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "peak_mem_mb": peak / (1024 * 1024),
+    }
+
+
+def _iter_frames(source, max_frames):
+    count = 0
+    while max_frames is None or count < max_frames:
+        ok, frame = source.read()
+        if not ok:
+            break
+        count += 1
+        yield frame
+    source.release()
+
+
+def _iter_audio(path, chunk):
+    source = WavFileSource(path)
+    try:
+        while True:
+            audio = source.read(chunk)
+            if audio is None or audio.size < chunk:
+                break
+            yield audio
+    finally:
+        source.close()
+
+
+def _write_synthetic_wav(path, seconds=30, rate=44100):
+    """Background noise with a loud 1 kHz burst every two seconds."""
+    rng = np.random.default_rng(0)
+    audio = rng.normal(0, 50, seconds * rate)
+    t = np.arange(int(0.2 * rate)) / rate
+    burst = 8000 * np.sin(2 * np.pi * 1000 * t)
+    for start in range(rate, len(audio) - len(burst), 2 * rate):
+        audio[start:start + len(burst)] += burst
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.clip(audio, -32768, 32767).astype(np.int16).tobytes())
+
+
+def _load_faces(path):
+    import face_recognition
+
+    image = face_recognition.load_image_file(path)
+    encodings = face_recognition.face_encodings(image)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return [{"name": name, "encoding": enc} for enc in encodings]
+
+
+def bench_video(path, faces_path, max_frames, repeat):
+    from video_recognizer import VideoRecognizer
+
+    faces = _load_faces(faces_path) if faces_path else []
+    recognizer = VideoRecognizer(faces=faces, show=False)
+    def frames():
+        if os.path.isdir(path) or path.lower().endswith((".png", ".jpg", ".jpeg", ".bmp")):
+            source = ImageSource(path, repeat=repeat)
+        else:
+            source = open_video_source(path)
+        if not source.is_opened():
+            raise SystemExit(f"Could not open video fixture: {path}")
+        return _iter_frames(source, max_frames)
+
+    return [_measure("video.anomalyDetected", frames, recognizer.anomalyDetected)]
+
+
+def bench_audio(path, chunk, hop):
+    from sound_recognizer import SoundRecognizer, StreamingAnalyzer, compute_sound_features
+
+    probe = WavFileSource(path)
+    rate = probe.rate
+    probe.close()
+    features = _measure(
+        "audio.compute_sound_features",
+        lambda: _iter_audio(path, chunk),
+        lambda audio: compute_sound_features(audio, rate),
+    )
+    recognizer = SoundRecognizer(source=WavFileSource(path), chunk=chunk)
+    evaluate = _measure("audio._evaluate_audio", lambda: _iter_audio(path, chunk), recognizer._evaluate_audio)
+    recognizer.source.close()
+
+    analyzer = StreamingAnalyzer(rate, chunk, hop)
+    streaming = _measure("audio.StreamingAnalyzer.push", lambda: _iter_audio(path, hop), analyzer.push)
+
+    # seconds of audio analysed per wall-clock second
+    for result, block in ((features, chunk), (evaluate, chunk), (streaming, hop)):
+        result["realtime_factor"] = result["throughput_per_sec"] * block / rate
+    return [features, evaluate, streaming]
+
+
+class _StubBackendHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"status":"event queued"}'
+        self.send_response(202)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def bench_sender(events):
+    from event_sender import EventSender
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubBackendHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        sender = EventSender(device_id="benchmark-device", api_key="sk_device_benchmark")
+        sender.backend_url = f"http://127.0.0.1:{server.server_address[1]}/API/"
+        sender.configure_limits(cooldown=0)  # measure the send path, not the rate limit
+        detection = {"label": "Mid-frequency sound (e.g., clap, knock)", "energy": 900.0, "centroid": 1800.0}
+        return [_measure("sender.sendAudioEvent", lambda: range(events), lambda _: sender.sendAudioEvent(dict(detection)))]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _print_results(results):
+    print(f"{'stage':32} {'count':>7} {'per sec':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>9}")
+    for r in results:
+        print(f"{r['stage']:32} {r['count']:>7} {r['throughput_per_sec']:>10.1f} "
+              f"{r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['peak_mem_mb']:>9.2f}")
+        if "realtime_factor" in r:
+            print(f"{'':32} {r['realtime_factor']:.1f}x real time")
+    try:
+        import resource
+
+        print(f"Process peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB")
+    except ImportError:
+        pass
+
+
+def _build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the device detection and event paths on recorded fixtures.")
+    parser.add_argument("--video", default=DEFAULT_FACE_IMAGE, help="Video file, image or image directory to replay.")
+    parser.add_argument("--faces", default=DEFAULT_FACE_IMAGE, help="Image with the known face(s) to match against.")
+    parser.add_argument("--frames", type=int, help="Maximum number of video frames to process.")
+    parser.add_argument("--repeat", type=int, default=50, help="Times to repeat an image fixture.")
+    parser.add_argument("--wav", help="16-bit PCM WAV fixture (default: generated).")
+    parser.add_argument("--chunk", type=int, default=4096, help="Audio block size in samples.")
+    parser.add_argument("--hop", type=int, default=1024, help="Streaming analysis hop size in samples.")
+    parser.add_argument("--events", type=int, default=200, help="Number of events to send to the stub backend.")
+    parser.add_argument("--skip", action="append", default=[], choices=["video", "audio", "sender"], help="Skip a stage group.")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    return parser
+
+
+if __name__ == "__main__":
+    args = _build_arg_parser().parse_args()
+    results = []
+
+    if "video" not in args.skip:
+        results += bench_video(args.video, args.faces, args.frames, args.repeat)
+
+    if "audio" not in args.skip:
+        if args.wav:
+            results += bench_audio(args.wav, args.chunk, args.hop)
+        else:
+            with tempfile.TemporaryDirectory() as tmp:
+                wav_path = os.path.join(tmp, "synthetic.wav")
+                _write_synthetic_wav(wav_path)
+                results += bench_audio(wav_path, args.chunk, args.hop)
+
+    if "sender" not in args.skip:
+        results += bench_sender(args.events)
+
+    _print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -10,14 +10,17 @@ import pyaudio
 import hashlib
 import hmac
 
-from event_sender import EventSender
+import metrics
+from event_sender import EVENT_BURST, EventSender
 from sound_recognizer import SoundRecognizer, list_input_devices
-from video_recognizer import VideoRecognizer, list_video_devices
+from video_recognizer import MultiVideoRecognizer, list_video_devices
+from sources import open_video_source
 
 DEVICE_CONFIG = "device_config.json"
 BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8000/API/")
 LOGIN_URL = os.environ.get("LOGIN_URL", "http://localhost:8000/auth/login")
 EVENT_COOLDOWN_SEC = float(os.environ.get("EVENT_COOLDOWN_SEC", "1.0"))
+METRICS_PORT = int(os.environ.get("DEVICE_METRICS_PORT", "0"))
 
 def load_device_credentials():
     """Load stored device credentials."""
@@ -60,15 +63,19 @@ def poll_for_user_assignment(api_key, max_wait_sec=300, sender: EventSender =Non
 
 def _build_parser():
     parser = argparse.ArgumentParser(description="Capture audio triggers and forward them to the backend.")
-    parser.add_argument("--audio-device-index", type=int, help="Input audio device index to use (use --list-devices to inspect).")
-    parser.add_argument("--video-device-index", type=int, help="Input video device index to use (use --list-devices to inspect).")
+    parser.add_argument("--audio-device-index", type=int, nargs="+", help="Input audio device index(es) to use (use --list-devices to inspect).")
+    parser.add_argument("--video-device-index", nargs="+", help="Input video device index(es) or video files to use (use --list-devices to inspect).")
+    parser.add_argument("--no-display", action="store_true", help="Do not open video preview windows (headless devices).")
     parser.add_argument("--device-name", help="Preferred device name substring (e.g., Logitech)")
     parser.add_argument("--list-devices", action="store_true", help="Show available microphone devices and exit.")
-    parser.add_argument("--cooldown", type=float, default=EVENT_COOLDOWN_SEC, help="Minimum seconds between backend events.")
+    parser.add_argument("--cooldown", type=float, default=EVENT_COOLDOWN_SEC, help="Seconds per event token, per event type; extra detections are coalesced.")
+    parser.add_argument("--event-burst", type=int, default=EVENT_BURST, help="Events of one type that may be sent back to back before coalescing starts.")
     parser.add_argument("--energy-threshold", type=float, default=200.0, help="Energy threshold passed to the recognizer to filter noise.")
     parser.add_argument("--delta-threshold", type=float, default=120.0, help="Minimum energy above the noise floor to trigger an event.")
     parser.add_argument("--silence-frames", type=int, default=4, help="Number of quiet frames required before allowing another trigger.")
     parser.add_argument("--new-face", action="store_true", help="Capture a new face encoding for this device.", default=False)
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Serve Prometheus metrics on this local port (0 disables).")
+    parser.add_argument("--metrics-log-interval", type=float, default=0, help="Also log a JSON metrics line every N seconds (0 disables).")
     return parser
 
 def main():
@@ -82,6 +89,9 @@ def main():
         list_video_devices()
         return
 
+    if args.metrics_port or args.metrics_log_interval:
+        metrics.enable(port=args.metrics_port, log_interval=args.metrics_log_interval)
+
     # Load device credentials (no user login needed!)
     try:
         config = load_device_credentials()
@@ -94,13 +104,17 @@ def main():
     print(f"Device UUID: {device_uuid}")
     print(f"Tell user to enter this UUID on frontend to claim device.")
 
+    video_specs = args.video_device_index or ["0"]
+    audio_indices = args.audio_device_index or [0]
+
     # Now create EventSender with device info (no user token needed)
     sender = EventSender(
         device_id=device_uuid,
         api_key=api_key,  # device uses API key, not user token
         cooldown=args.cooldown,
-        video_device_index=args.video_device_index,
-        audio_device_index=args.audio_device_index
+        burst=args.event_burst,
+        video_device_index=video_specs[0],
+        audio_device_index=audio_indices[0]
     )
 
     # Register with backend
@@ -144,29 +158,39 @@ def main():
     else:
         known_faces = sender.getFaces()
 
-    soundSensor = SoundRecognizer(
-        device_index=args.audio_device_index or 0,
-        device_name=args.device_name,
-        callback=sender.sendAudioEvent,
-        energy_threshold=args.energy_threshold,
-        delta_threshold=args.delta_threshold,
-        silence_frames=args.silence_frames,
-    )
+    # One PyAudio instance for every microphone
+    soundSensors = [
+        SoundRecognizer(
+            device_index=index,
+            device_name=args.device_name,
+            callback=sender.sendAudioEvent,
+            energy_threshold=args.energy_threshold,
+            delta_threshold=args.delta_threshold,
+            silence_frames=args.silence_frames,
+            source_name=f"mic{index}",
+            pa=pa,
+        )
+        for index in audio_indices
+    ]
 
-    videoSensor = VideoRecognizer(
-        device_index=args.video_device_index or 0,
-        device_name=args.device_name,
-        callback=sender.sendVideoEvent,
+    # All cameras share one face model, gallery and inference thread
+    videoSensor = MultiVideoRecognizer(
         faces=known_faces,
+        sources={
+            (f"camera{spec}" if str(spec).isdigit() else os.path.basename(spec)): open_video_source(spec)
+            for spec in video_specs
+        },
+        callback=sender.sendVideoEvent,
+        show=not args.no_display,
     )
 
     try:
-        audio_thread = threading.Thread(target=soundSensor.run, daemon=True)
-        video_thread = threading.Thread(target=videoSensor.run, daemon=True)
-        audio_thread.start()
-        video_thread.start()
+        threads = [threading.Thread(target=sensor.run, daemon=True) for sensor in soundSensors]
+        threads.append(threading.Thread(target=videoSensor.run, daemon=True))
+        for thread in threads:
+            thread.start()
 
-        while audio_thread.is_alive() and video_thread.is_alive():
+        while all(thread.is_alive() for thread in threads):
             time.sleep(0.2)
     except KeyboardInterrupt:
         print("\nStopping device listener...")
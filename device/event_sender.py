@@ -9,9 +9,18 @@ import numpy as np
 import json
 import hashlib
 import hmac
+import threading
+from collections import deque
+
+import metrics
 
 BACKEND_URL = os.environ.get("BACKEND_URL", "http://localhost:8000/API/")
 EVENT_COOLDOWN_SEC = float(os.environ.get("EVENT_COOLDOWN_SEC", "1.0"))
+EVENT_BURST = int(os.environ.get("EVENT_BURST", "3"))
+# Events per type held while the backend asks us to back off (503 + Retry-After)
+MAX_DEFERRED_EVENTS = 50
+# Unknown faces closer than this are treated as the same person when coalescing
+UNKNOWN_TRACK_TOLERANCE = 0.6
 
 def prepare_frame(frame):
     if frame is None:
@@ -25,24 +34,80 @@ def prepare_frame(frame):
     rgb = np.ascontiguousarray(rgb, dtype=np.uint8)
     return rgb
 
+def _retry_after(response, default=1.0):
+    """Seconds to wait from a Retry-After header (delta-seconds form only)."""
+    try:
+        return max(0.0, float(response.headers.get("Retry-After", default)))
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """Allows bursts of up to `burst` events, refilling one token every `interval` seconds."""
+
+    def __init__(self, interval, burst=1):
+        self.interval = interval
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.interval <= 0:
+            self.tokens = float(self.burst)
+        else:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+        self.updated = now
+
+    def try_take(self):
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self):
+        """Seconds until the next token is available."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) * self.interval
+
+
 class EventSender:
-    """Throttles detection events and forwards them to the backend using device API key."""
+    """Rate-limits detection events per type and forwards them to the backend using device API key.
+
+    Detections that arrive while their type is out of tokens are not dropped:
+    they are coalesced into one aggregated event that is sent as soon as the
+    next token is available. When the backend answers 503 the event is held
+    and resent after Retry-After, and new detections of that type are
+    coalesced until then.
+    """
 
-    def __init__(self, device_id, api_key, video_device_index=None, audio_device_index=None, cooldown=EVENT_COOLDOWN_SEC):
+    EVENT_TYPES = ("audio_trigger", "video_trigger", "add_face")
+
+    def __init__(self, device_id, api_key, video_device_index=None, audio_device_index=None, cooldown=EVENT_COOLDOWN_SEC, burst=EVENT_BURST):
         self.backend_url = BACKEND_URL
         self.device_id = device_id
         self.api_key = api_key
-        self.cooldown = max(cooldown, 0.2)
-        self._last_sent = 0.0
         self.video_device_index = video_device_index
         self.audio_device_index = audio_device_index
+        self._lock = threading.Lock()
+        self.configure_limits(max(cooldown, 0.2), burst)
+
+    def configure_limits(self, cooldown, burst=1):
+        """Set the per-type limit to one event per `cooldown` seconds with bursts of `burst` (0 disables)."""
+        with self._lock:
+            self.cooldown = cooldown
+            self._buckets = {t: TokenBucket(cooldown, burst) for t in self.EVENT_TYPES}
+            self._pending = {}  # event type -> aggregate of suppressed detections
+            self._deferred = {t: deque() for t in self.EVENT_TYPES}  # payloads the backend asked us to resend
+            self._backoff_until = {t: 0.0 for t in self.EVENT_TYPES}  # monotonic time set from Retry-After
 
     def sign_request(self, method, body_json, ts, secret):
         msg = f"{method}\n{ts}\n{body_json}"
         return hmac.new(secret.encode(), msg.encode(), hashlib.sha256).hexdigest()
 
     def send_request(self, url, event, device_id, device_secret, request_method="POST"):
-        url = BACKEND_URL + url
+        url = self.backend_url + url
         ts = str(int(time.time()))
         body_json = json.dumps(event, separators=(',', ':'))
         sig = self.sign_request(request_method, body_json, ts, device_secret)
@@ -55,68 +120,172 @@ class EventSender:
         }
         with requests.Session() as s:
             s.headers.update(headers)
-        if request_method == "GET":
-            r = s.get(url, headers=headers, timeout=10, stream=False)
-        elif request_method == "POST":
-            r = s.post(url, headers=headers, data=body_json, timeout=10, stream=False)
-        elif request_method == "DELETE":
-            r = s.delete(url, headers=headers, timeout=10, stream=False)
-        elif request_method == "PUT":
-            r = s.put(url, headers=headers, data=body_json, timeout=10, stream=False)
-        else:
-            raise ValueError(f"Unsupported request method: {request_method}")
+        with metrics.timer("http", method=request_method):
+            if request_method == "GET":
+                r = s.get(url, headers=headers, timeout=10, stream=False)
+            elif request_method == "POST":
+                r = s.post(url, headers=headers, data=body_json, timeout=10, stream=False)
+            elif request_method == "DELETE":
+                r = s.delete(url, headers=headers, timeout=10, stream=False)
+            elif request_method == "PUT":
+                r = s.put(url, headers=headers, data=body_json, timeout=10, stream=False)
+            else:
+                raise ValueError(f"Unsupported request method: {request_method}")
         # print(f"Sent {request_method} request to {url}, status code: {r.status_code}. Response: {r.text}")
         return r
 
     def sendAudioEvent(self, detection):
-        now = time.time()
-        if now - self._last_sent < self.cooldown:
-            return
-        self._last_sent = now
+        self._dispatch("audio_trigger", detection)
 
-        created_at = detection.get("created_at", now)
+    def sendVideoEvent(self, detection):
+        self._dispatch("video_trigger", detection)
 
-        payload = {
-            "event_type": "audio_trigger",
-            "created_at": created_at,
-            "details": {
+    def _build_payload(self, event_type, detection):
+        created_at = detection.get("created_at", time.time())
+        if event_type == "audio_trigger":
+            details = {
                 "description": detection["label"],
                 "energy": detection["energy"],
                 "spectral_centroid": detection["centroid"],
-            },
+                "source": detection.get("source"),
+            }
+        else:
+            details = {
+                "description": detection.get("details", ""),
+                "source": detection.get("source"),
+                "unknown_faces": len(detection.get("unknown_encodings", [])),
+            }
+        return {"event_type": event_type, "created_at": created_at, "details": details}
+
+    def _coalesce(self, event_type, aggregate, detection):
+        """Fold a detection into the aggregate for its type."""
+        created_at = detection.get("created_at", time.time())
+        if aggregate is None:
+            aggregate = {
+                "first": detection,
+                "count": 0,
+                "first_at": created_at,
+                "last_at": created_at,
+                "peak_energy": None,
+                "labels": set(),
+                "sources": set(),
+                "unknown_tracks": [],
+            }
+        aggregate["count"] += 1
+        aggregate["last_at"] = created_at
+        if detection.get("source"):
+            aggregate["sources"].add(detection["source"])
+        if event_type == "audio_trigger":
+            aggregate["labels"].add(detection["label"])
+            if aggregate["peak_energy"] is None or detection["energy"] > aggregate["peak_energy"]:
+                aggregate["peak_energy"] = detection["energy"]
+        for enc in detection.get("unknown_encodings", []):
+            # one representative encoding per distinct unknown person
+            tracks = aggregate["unknown_tracks"]
+            if not tracks or min(np.linalg.norm(np.asarray(t) - enc) for t in tracks) > UNKNOWN_TRACK_TOLERANCE:
+                tracks.append(enc)
+        return aggregate
+
+    def _aggregate_payload(self, event_type, aggregate):
+        if aggregate["count"] == 1:
+            return self._build_payload(event_type, aggregate["first"])
+        details = {
+            "description": f"{aggregate['count']} {event_type} detections coalesced",
+            "coalesced": True,
+            "count": aggregate["count"],
+            "first_at": aggregate["first_at"],
+            "last_at": aggregate["last_at"],
+            "sources": sorted(aggregate["sources"]),
         }
+        if event_type == "audio_trigger":
+            details["peak_energy"] = aggregate["peak_energy"]
+            details["labels"] = sorted(aggregate["labels"])
+        else:
+            details["distinct_unknown_tracks"] = len(aggregate["unknown_tracks"])
+        return {"event_type": event_type, "created_at": aggregate["first_at"], "details": details}
 
+    def _dispatch(self, event_type, detection):
+        with self._lock:
+            bucket = self._buckets[event_type]
+            aggregate = self._pending.get(event_type)
+            backoff = self._backoff_remaining(event_type)
+            if backoff > 0 or not bucket.try_take():
+                self._pending[event_type] = self._coalesce(event_type, aggregate, detection)
+                metrics.inc("events_coalesced", event_type=event_type)
+                if aggregate is None:
+                    self._schedule_flush(event_type, max(backoff, bucket.wait_time()))
+                return
+            if aggregate is not None:
+                # a token is free again: send everything held back plus this detection
+                payload = self._aggregate_payload(event_type, self._coalesce(event_type, aggregate, detection))
+                del self._pending[event_type]
+            else:
+                payload = self._build_payload(event_type, detection)
         try:
-            response = self.send_request(
-                url="events/add_event",
-                event=payload,
-                device_id=self.device_id,
-                device_secret=self.api_key,
-                request_method="POST"
-            )
-        except requests.RequestException as exc:
-            raise Exception(f"Failed to send event: {exc}")
+            self._post_event(payload)
+        except Exception as e:
+            # already counted in events_failed; never let a backend error stop a sensor thread
+            print(f"Failed to send {event_type} event: {e}")
 
-        if response.status_code >= 400:
-            raise Exception(f"Backend error {response.status_code}: {response.text}")
-        else:
-            timestamp_str = datetime.datetime.now().strftime("%H:%M:%S")
-            print(f"[{timestamp_str}] Event forwarded: {payload['details']['description']}")
+    def _schedule_flush(self, event_type, delay):
+        timer = threading.Timer(delay, self._flush_pending, args=(event_type,))
+        timer.daemon = True
+        timer.start()
 
-    def sendVideoEvent(self, detection):
-        now = time.time()
-        if now - self._last_sent < self.cooldown:
-            return
-        self._last_sent = now
+    def _backoff_remaining(self, event_type):
+        return max(0.0, self._backoff_until[event_type] - time.monotonic())
 
-        created_at = detection.get("created_at", now)
+    def _defer(self, payloads, delay):
+        """Hold payloads the backend refused with 503 and retry them after `delay` seconds."""
+        event_type = payloads[0]["event_type"]
+        with self._lock:
+            deferred = self._deferred[event_type]
+            was_empty = not deferred
+            for payload in payloads:
+                if len(deferred) >= MAX_DEFERRED_EVENTS:
+                    deferred.popleft()
+                    metrics.inc("events_failed", event_type=event_type)
+                deferred.append(payload)
+                metrics.inc("events_deferred", event_type=event_type)
+            self._backoff_until[event_type] = max(self._backoff_until[event_type], time.monotonic() + delay)
+            if was_empty:
+                self._schedule_flush(event_type, delay)
 
-        payload = {
-            "event_type": "video_trigger",
-            "created_at": created_at,
-            "details": detection.get("details", {}),
-        }
+    def _flush_pending(self, event_type):
+        with self._lock:
+            deferred = self._deferred[event_type]
+            aggregate = self._pending.get(event_type)
+            if aggregate is None and not deferred:
+                return  # already sent along with a newer detection
+            backoff = self._backoff_remaining(event_type)
+            if backoff > 0:
+                self._schedule_flush(event_type, backoff)
+                return
+            # resend what the backend refused first; it already used its tokens
+            payloads = list(deferred)
+            deferred.clear()
+            if aggregate is not None:
+                bucket = self._buckets[event_type]
+                if bucket.try_take():
+                    del self._pending[event_type]
+                    payloads.append(self._aggregate_payload(event_type, aggregate))
+                else:
+                    self._schedule_flush(event_type, bucket.wait_time())
+        for i, payload in enumerate(payloads):
+            try:
+                delay = self._post_event(payload)
+            except Exception as e:
+                print(f"Failed to send coalesced {event_type} event: {e}")
+                continue
+            if delay is not None:
+                # backend is still busy; keep the rest in order behind the refused one
+                if payloads[i + 1:]:
+                    self._defer(payloads[i + 1:], delay)
+                return
 
+    def _post_event(self, payload):
+        """POST one event. Returns the Retry-After delay if the backend deferred it, else None."""
+        event_type = payload["event_type"]
         try:
             response = self.send_request(
                 url="events/add_event",
@@ -126,20 +295,56 @@ class EventSender:
                 request_method="POST"
             )
         except requests.RequestException as exc:
+            metrics.inc("events_failed", event_type=event_type)
             raise Exception(f"Failed to send event: {exc}")
 
+        if response.status_code == 503:
+            # ingest buffer is full: normal backpressure, not a failure
+            delay = _retry_after(response)
+            print(f"Backend busy, retrying {event_type} event in {delay:.0f}s")
+            self._defer([payload], delay)
+            return delay
         if response.status_code >= 400:
+            metrics.inc("events_failed", event_type=event_type)
             raise Exception(f"Backend error {response.status_code}: {response.text}")
-        else:
-            timestamp_str = datetime.datetime.now().strftime("%H:%M:%S")
-            print(f"[{timestamp_str}] Event forwarded: video_trigger")
+        metrics.inc("events_sent", event_type=event_type)
+        timestamp_str = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{timestamp_str}] Event forwarded: {event_type}: {payload['details']['description']}")
+        return None
+
+    def sendEvents(self, events, batch_size=500, max_retries=5):
+        """Upload already-built event payloads in bulk (no cooldown applied)."""
+        sent = 0
+        for start in range(0, len(events), batch_size):
+            batch = events[start:start + batch_size]
+            for attempt in range(max_retries + 1):
+                try:
+                    response = self.send_request(
+                        url="events/add_events",
+                        event={"events": batch},
+                        device_id=self.device_id,
+                        device_secret=self.api_key,
+                        request_method="POST"
+                    )
+                except requests.RequestException as exc:
+                    raise Exception(f"Failed to send events: {exc}")
+                if response.status_code != 503 or attempt == max_retries:
+                    break
+                # backend ingest buffer is full; wait as asked and retry the same batch
+                time.sleep(_retry_after(response))
+
+            if response.status_code >= 400:
+                raise Exception(f"Backend error {response.status_code}: {response.text}")
+            sent += len(batch)
+        timestamp_str = datetime.datetime.now().strftime("%H:%M:%S")
+        print(f"[{timestamp_str}] Uploaded {sent} events")
+        return sent
 
     def addNewFace(self, name):
         
-        now = time.time()
-        if now - self._last_sent < self.cooldown:
-            return
-        self._last_sent = now
+        with self._lock:
+            if not self._buckets["add_face"].try_take():
+                return
 
         # make sure name isn't invalid
         name = name.strip()
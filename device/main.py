@@ -5,14 +5,18 @@ import sys
 
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--audio-device-index", type=int)
-    parser.add_argument("--video-device-index", type=int)
+    parser.add_argument("--audio-device-index", type=int, nargs="+")
+    parser.add_argument("--video-device-index", nargs="+")
+    parser.add_argument("--no-display", action="store_true")
     parser.add_argument("--device-name")
     parser.add_argument("--cooldown", type=float)
+    parser.add_argument("--event-burst", type=int)
     parser.add_argument("--energy-threshold", type=float)
     parser.add_argument("--delta-threshold", type=float)
     parser.add_argument("--silence-frames", type=int)
     parser.add_argument("--new-face", action="store_true")
+    parser.add_argument("--metrics-port", type=int)
+    parser.add_argument("--metrics-log-interval", type=float)
     args = parser.parse_args()
 
     cmd = ["python3", "device.py"] + sys.argv[1:]
@@ -0,0 +1,184 @@
+# metrics.py
+# Hot-path instrumentation: per-stage timers, counters and gauges.
+# Everything is a no-op until enable() is called, so instrumented code pays
+# one function call and a flag check when metrics are off.
+# -----------------------------------------------------------
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "zerosight"
+# Stage latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_enabled = False
+_lock = threading.Lock()
+_stages = {}    # (stage, labels) -> [bucket counts..., sum, count]
+_counters = {}  # (name, labels) -> value
+_gauges = {}    # (name, labels) -> callable returning the current value
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("stage", "labels", "t0")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.stage, time.perf_counter() - self.t0, **self.labels)
+        return False
+
+
+def enabled():
+    return _enabled
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def timer(stage, **labels):
+    """Context manager timing one pass through a pipeline stage."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _StageTimer(stage, labels)
+
+
+def observe(stage, seconds, **labels):
+    if not _enabled:
+        return
+    key = _key(stage, labels)
+    with _lock:
+        entry = _stages.get(key)
+        if entry is None:
+            entry = _stages[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                entry[i] += 1
+        entry[-2] += seconds
+        entry[-1] += 1
+
+
+def inc(name, amount=1, **labels):
+    """Increase a counter (frames dropped, events sent, ...)."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def gauge(name, fn, **labels):
+    """Register a callable sampled whenever metrics are exported (e.g. a queue size)."""
+    with _lock:
+        _gauges[_key(name, labels)] = fn
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _sample_gauges():
+    values = {}
+    for key, fn in list(_gauges.items()):
+        try:
+            values[key] = float(fn())
+        except Exception:
+            continue
+    return values
+
+
+def render_prometheus():
+    """Current metrics in the Prometheus text exposition format."""
+    with _lock:
+        stages = {k: list(v) for k, v in _stages.items()}
+        counters = dict(_counters)
+    lines = []
+    if stages:
+        lines.append(f"# TYPE {PREFIX}_stage_seconds histogram")
+    for (stage, labels), entry in sorted(stages.items()):
+        labels = (("stage", stage),) + labels
+        for bound, count in zip(BUCKETS, entry):
+            lines.append(f"{PREFIX}_stage_seconds_bucket{_format_labels(labels, [('le', bound)])} {count}")
+        lines.append(f"{PREFIX}_stage_seconds_bucket{_format_labels(labels, [('le', '+Inf')])} {entry[-1]}")
+        lines.append(f"{PREFIX}_stage_seconds_sum{_format_labels(labels)} {entry[-2]}")
+        lines.append(f"{PREFIX}_stage_seconds_count{_format_labels(labels)} {entry[-1]}")
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            typed.add(name)
+        lines.append(f"{PREFIX}_{name}_total{_format_labels(labels)} {value}")
+    for (name, labels), value in sorted(_sample_gauges().items()):
+        if name not in typed:
+            lines.append(f"# TYPE {PREFIX}_{name} gauge")
+            typed.add(name)
+        lines.append(f"{PREFIX}_{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """Compact dict of current metrics, used for the periodic log line."""
+    def name(key):
+        return key[0] + _format_labels(key[1])
+
+    with _lock:
+        stages = {name(k): {"count": v[-1], "avg_ms": round(v[-2] / v[-1] * 1000, 3) if v[-1] else 0.0}
+                  for k, v in _stages.items()}
+        counters = {name(k): v for k, v in _counters.items()}
+    gauges = {name(k): v for k, v in _sample_gauges().items()}
+    return {"ts": time.time(), "stages": stages, "counters": counters, "gauges": gauges}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _log_loop(interval):
+    while True:
+        time.sleep(interval)
+        print(json.dumps({"metrics": snapshot()}), flush=True)
+
+
+def enable(port=None, log_interval=None, host="127.0.0.1"):
+    """Turn instrumentation on, optionally serving /metrics and logging periodically."""
+    global _enabled
+    _enabled = True
+    if port:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Metrics available at http://{host}:{port}/metrics")
+    if log_interval:
+        threading.Thread(target=_log_loop, args=(log_interval,), daemon=True).start()
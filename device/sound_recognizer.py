@@ -9,6 +9,7 @@
 
 import argparse
 import datetime
+import os
 import queue
 import threading
 import time
@@ -18,8 +19,94 @@ import librosa
 import numpy as np
 import pyaudio
 
+import metrics
+from sources import MicrophoneSource, WavFileSource
+
 CHUNK = 4096
 RATE = 44100
+# Streaming analysis: a CHUNK-long window evaluated every HOP input samples,
+# optionally on a decimated copy of the signal. Off (0) by default: decimating
+# to e.g. 16000 low-passes at ~0.45x that rate, so whistles and chirps above
+# ~6.6 kHz stop triggering and the energy thresholds need lowering.
+HOP = int(os.environ.get("AUDIO_HOP", "1024"))
+ANALYSIS_RATE = int(os.environ.get("AUDIO_ANALYSIS_RATE", "0"))
+HOPS_PER_READ = int(os.environ.get("AUDIO_HOPS_PER_READ", "1"))
+# Hops to look ahead after a trigger for its peak energy; each one delays the event by a hop
+PEAK_HOPS = int(os.environ.get("AUDIO_PEAK_HOPS", "0"))
+
+
+class _Decimator:
+    """Streaming low-pass FIR filter plus integer downsampling.
+
+    Only the samples that survive downsampling are filtered (polyphase), so the
+    cost is taps / factor multiply-adds per input sample.
+    """
+
+    def __init__(self, factor, taps=63):
+        self.factor = factor
+        n = np.arange(taps) - (taps - 1) / 2
+        cutoff = 0.9 / factor  # keep a margin below the new Nyquist frequency
+        h = cutoff * np.sinc(cutoff * n) * np.hamming(taps)
+        self.taps = (h / h.sum()).astype(np.float32)
+        self._kernel = self.taps[::-1].copy()  # convolution as a dot product with each window
+        self._tail = np.zeros(taps - 1, dtype=np.float32)
+        self._phase = 0  # offset of the next kept sample in the next block
+
+    def process(self, audio):
+        if audio.size == 0:
+            return np.zeros(0, dtype=np.float32)
+        buf = np.concatenate([self._tail, audio.astype(np.float32, copy=False)])
+        # windows ending at each kept sample; same output as np.convolve(buf, taps, "valid")[phase::factor]
+        windows = np.lib.stride_tricks.sliding_window_view(buf, len(self.taps))[self._phase::self.factor]
+        out = windows @ self._kernel
+        self._tail = buf[len(buf) - (len(self.taps) - 1):]
+        self._phase = (self._phase - len(audio)) % self.factor
+        return out
+
+
+class StreamingAnalyzer:
+    """Overlapping-window energy and spectral centroid over a continuous stream.
+
+    push() accepts blocks of any size and returns features for every hop
+    completed by the block, computed together in one vectorized FFT.
+    """
+
+    def __init__(self, rate=RATE, window=CHUNK, hop=HOP, analysis_rate=ANALYSIS_RATE):
+        factor = max(1, int(round(rate / analysis_rate))) if analysis_rate else 1
+        self.factor = factor
+        self._decimator = _Decimator(factor) if factor > 1 else None
+        self.rate = rate / factor
+        self.window = max(64, window // factor)  # same duration as at the input rate
+        self.hop = max(1, hop // factor)
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._consumed = 0  # analysis-rate index of the first sample in _buffer
+        self._taper = np.hanning(self.window).astype(np.float32)
+        self._freqs = np.fft.rfftfreq(self.window, 1.0 / self.rate).astype(np.float32)
+
+    def push(self, audio):
+        """Return (energies, centroids, offsets) arrays, one entry per completed hop.
+
+        offsets are the input-rate sample positions where each window starts,
+        counted from the first sample ever pushed.
+        """
+        if self._decimator is not None:
+            audio = self._decimator.process(audio)
+        buf = np.concatenate([self._buffer, audio.astype(np.float32, copy=False)])
+        count = (len(buf) - self.window) // self.hop + 1 if len(buf) >= self.window else 0
+        if count == 0:
+            self._buffer = buf
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        frames = np.lib.stride_tricks.sliding_window_view(buf, self.window)[::self.hop][:count]
+        energies = np.abs(frames).mean(axis=1)
+        spectrum = np.abs(np.fft.rfft(frames * self._taper, axis=1))
+        totals = spectrum.sum(axis=1)
+        centroids = np.divide(spectrum @ self._freqs, totals, out=np.zeros_like(totals), where=totals > 0)
+        offsets = (self._consumed + np.arange(count, dtype=np.int64) * self.hop) * self.factor
+        self._buffer = buf[count * self.hop:]
+        self._consumed += count * self.hop
+        return energies, centroids, offsets
+
 
 class SoundRecognizer:
     """Streams audio, runs detection, and emits events once noise subsides."""
@@ -34,41 +121,63 @@ class SoundRecognizer:
         energy_threshold=200.0,
         delta_threshold=120.0,
         silence_frames=4,
+        source=None,
+        source_name=None,
+        pa=None,
+        hop=HOP,
+        analysis_rate=ANALYSIS_RATE,
+        hops_per_read=HOPS_PER_READ,
+        peak_hops=PEAK_HOPS,
     ):
         self.chunk = chunk
-        self.rate = rate
+        self.hop = max(1, min(hop, chunk))
+        # reading several hops at once trades a little latency for fewer, larger FFT batches
+        self.read_frames = self.hop * max(1, hops_per_read)
         self.callback = callback
-        self.audio_queue = queue.Queue()
-        self.pa = pyaudio.PyAudio()
-        self.device_index = select_device_index(self.pa, preferred_name=device_name, explicit_index=device_index)
-        if self.device_index is None:
-            raise SystemExit("Unable to find a valid audio input device.")
-
-        self.stream = self.pa.open(
-            format=pyaudio.paInt16,
-            rate=self.rate,
-            channels=1,
-            input=True,
-            input_device_index=self.device_index,
-            frames_per_buffer=self.chunk,
-        )
+        self.source_name = source_name  # tag added to detections, e.g. "mic1"
+        if source is None:
+            # a PyAudio instance passed in is shared with other recognizers and not terminated here
+            owns_pa = pa is None
+            pa = pa or pyaudio.PyAudio()
+            self.device_index = select_device_index(pa, preferred_name=device_name, explicit_index=device_index)
+            if self.device_index is None:
+                raise SystemExit("Unable to find a valid audio input device.")
+            source = MicrophoneSource(pa, self.device_index, rate, self.read_frames, owns_pa=owns_pa, name=source_name)
+        else:
+            self.device_index = None
+        self.source = source
+        self.rate = getattr(source, "rate", rate)
+        # recorded sources are read faster than real time, so bound the backlog
+        self.audio_queue = queue.Queue(maxsize=0 if source.realtime else 64)
+        metrics.gauge("audio_queue_depth", self.audio_queue.qsize, source=source_name)
 
         self._running = False
+        self._exhausted = False
         self._reader_thread = None
         self._energy_threshold = energy_threshold
         self._delta_threshold = delta_threshold
-        self._silence_frames = max(1, silence_frames)
+        # silence_frames and the noise-floor history are in chunks; keep their duration at hop granularity
+        hops_per_chunk = max(1, chunk // self.hop)
+        self._silence_frames = max(1, silence_frames) * hops_per_chunk
         self._silence_counter = self._silence_frames
         self._armed = True
-        self._energy_history = deque(maxlen=80)
+        self._energy_history = deque(maxlen=80 * hops_per_chunk)
+        # report on the trigger hop, or on the loudest of the next peak_hops hops
+        self._peak_hops = max(0, peak_hops)
+        self._capture = None
+        self._analyzer = StreamingAnalyzer(self.rate, chunk, self.hop, analysis_rate)
+        self._extra_detections = deque()
 
     def _reader_loop(self):
         while self._running:
-            try:
-                data = self.stream.read(self.chunk, exception_on_overflow=False)
-            except IOError:
+            with metrics.timer("capture", source=self.source_name):
+                audio = self.source.read(self.read_frames)
+            if audio is None:
+                # recorded source ran out
+                self._exhausted = True
+                break
+            if audio.size == 0:
                 continue
-            audio = np.frombuffer(data, dtype=np.int16).astype(np.float32)
             self.audio_queue.put(audio)
 
     def start(self):
@@ -82,24 +191,51 @@ class SoundRecognizer:
         self._running = False
         if self._reader_thread:
             self._reader_thread.join(timeout=1.0)
-        self.stream.stop_stream()
-        self.stream.close()
-        self.pa.terminate()
+        self.source.close()
 
     def get_detection(self, block=False, timeout=None):
-        try:
-            audio = self.audio_queue.get(block=block, timeout=timeout)
-        except queue.Empty:
-            return None
+        if self._extra_detections:
+            detection = self._extra_detections.popleft()
+        else:
+            try:
+                audio = self.audio_queue.get(block=block, timeout=timeout)
+            except queue.Empty:
+                return None
 
-        detection = self._evaluate_audio(audio)
+            with metrics.timer("detect", source=self.source_name):
+                detection = self._evaluate_audio(audio)
         if detection:
-            # use iso format for timestamps
-            detection["created_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+            detection["source"] = self.source_name
         return detection
 
+    def analyze_block(self, audio):
+        """Feed a block of samples and return every detection completed by its hops.
+
+        Each detection carries sample_offset, the position of its trigger
+        window in samples since the first block fed to this recognizer.
+        """
+        energies, centroids, offsets = self._analyzer.push(audio)
+        detections = []
+        for energy, centroid, offset in zip(energies.tolist(), centroids.tolist(), offsets.tolist()):
+            detection = self._evaluate_hop(energy, centroid, offset)
+            if detection:
+                detections.append(detection)
+        return detections
+
+    def flush_detection(self):
+        """Return a detection still collecting its peak when the stream ends, if any."""
+        capture, self._capture = self._capture, None
+        return self._capture_detection(capture) if capture else None
+
     def _evaluate_audio(self, audio):
-        energy, centroid, label = compute_sound_features(audio)
+        detections = self.analyze_block(audio)
+        if not detections:
+            return None
+        # more than one trigger per block only happens with large multi-hop reads
+        self._extra_detections.extend(detections[1:])
+        return detections[0]
+
+    def _evaluate_hop(self, energy, centroid, offset=0):
         self._energy_history.append(energy)
         noise_floor = float(min(self._energy_history)) if self._energy_history else energy
         delta = energy - noise_floor
@@ -108,28 +244,55 @@ class SoundRecognizer:
             self._silence_counter = min(self._silence_counter + 1, self._silence_frames)
             if self._silence_counter >= self._silence_frames:
                 self._armed = True
+        elif self._armed:
+            self._silence_counter = 0
+            self._armed = False
+            self._capture = {
+                "energy": energy,
+                "centroid": centroid,
+                "offset": offset,
+                "hops": 0,
+                # use iso format for timestamps; the event happened at the trigger, not at the peak
+                "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+
+        capture = self._capture
+        if capture is None:
             return None
-
-        if not self._armed:
+        if energy > capture["energy"]:
+            capture["energy"] = energy
+            capture["centroid"] = centroid
+        capture["hops"] += 1
+        if capture["hops"] <= self._peak_hops:
             return None
+        self._capture = None
+        return self._capture_detection(capture)
 
-        self._silence_counter = 0
-        self._armed = False
-
+    def _capture_detection(self, capture):
         return {
-            "label": label,
-            "energy": float(energy),
-            "centroid": float(centroid),
+            "label": classify_centroid(capture["centroid"]),
+            "energy": float(capture["energy"]),
+            "centroid": float(capture["centroid"]),
+            "sample_offset": int(capture["offset"]),
+            "created_at": capture["created_at"],
         }
 
+    def _emit(self, detection):
+        if detection and self.callback:
+            with metrics.timer("dispatch", source=self.source_name):
+                self.callback(detection)
+
     def run(self, poll_timeout=0.1):
         self.start()
         print("Listening... (Ctrl+C to stop)\n")
         try:
-            while True:
-                detection = self.get_detection(block=True, timeout=poll_timeout)
-                if detection and self.callback:
-                    self.callback(detection)
+            while not (self._exhausted and self.audio_queue.empty() and not self._extra_detections):
+                self._emit(self.get_detection(block=True, timeout=poll_timeout))
+            # a recorded source ended while a trigger was still looking for its peak
+            detection = self.flush_detection()
+            if detection:
+                detection["source"] = self.source_name
+                self._emit(detection)
         except KeyboardInterrupt:
             raise
         finally:
@@ -188,9 +351,9 @@ def classify_centroid(centroid):
     return "High-frequency sound (e.g., whistle, chirp)"
 
 
-def compute_sound_features(audio):
+def compute_sound_features(audio, rate=RATE):
     energy = np.abs(audio).mean()
-    centroid = librosa.feature.spectral_centroid(y=audio, sr=RATE)
+    centroid = librosa.feature.spectral_centroid(y=audio, sr=rate)
     avg_centroid = centroid.mean()
     label = classify_centroid(avg_centroid)
     return energy, avg_centroid, label
@@ -206,9 +369,14 @@ def _build_arg_parser():
     parser.add_argument("--device-index", type=int, help="Use this input device index directly.")
     parser.add_argument("--device-name", help="Preferred name substring to match (e.g., Logitech).")
     parser.add_argument("--list-devices", action="store_true", help="Show plugged-in microphones and exit.")
+    parser.add_argument("--wav", help="Replay a 16-bit PCM WAV file instead of listening to a microphone.")
     parser.add_argument("--energy-threshold", type=float, default=200.0, help="Minimum average energy to consider a sound event.")
     parser.add_argument("--delta-threshold", type=float, default=120.0, help="Minimum energy above the noise floor.")
     parser.add_argument("--silence-frames", type=int, default=4, help="Number of quiet frames required before retriggering.")
+    parser.add_argument("--hop", type=int, default=HOP, help="Input samples between overlapping analysis windows.")
+    parser.add_argument("--analysis-rate", type=int, default=ANALYSIS_RATE, help="Decimate to about this rate before analysis (default 0, off; 16000 drops sounds above ~6.6 kHz).")
+    parser.add_argument("--peak-hops", type=int, default=PEAK_HOPS, help="Hops to look ahead after a trigger for its peak energy (adds latency).")
+    parser.add_argument("--hops-per-read", type=int, default=HOPS_PER_READ, help="Hops read and analysed per vectorized call.")
     return parser
 
 if __name__ == "__main__":
@@ -228,6 +396,11 @@ if __name__ == "__main__":
             energy_threshold=args.energy_threshold,
             delta_threshold=args.delta_threshold,
             silence_frames=args.silence_frames,
+            source=WavFileSource(args.wav) if args.wav else None,
+            hop=args.hop,
+            analysis_rate=args.analysis_rate,
+            hops_per_read=args.hops_per_read,
+            peak_hops=args.peak_hops,
     )
 
     try:
@@ -0,0 +1,171 @@
+# sources.py
+# Frame and audio sources for the recognizers: live devices or recorded files.
+# -----------------------------------------------------------
+import os
+import wave
+
+import cv2
+import numpy as np
+
+import metrics
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+class CameraSource:
+    """Live camera frames through cv2.VideoCapture."""
+
+    realtime = True
+
+    def __init__(self, device_index=0):
+        self.cap = cv2.VideoCapture(device_index)
+
+    def is_opened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        return self.cap.read()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(CameraSource):
+    """Frames decoded from a recorded video file."""
+
+    realtime = False
+
+    def __init__(self, path):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+
+    def fps(self):
+        return self.cap.get(cv2.CAP_PROP_FPS) or 0.0
+
+    def frame_count(self):
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def seek(self, frame_index):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+
+    def skip(self):
+        """Advance one frame without decoding it."""
+        return self.cap.grab()
+
+
+class ImageSource:
+    """Frames loaded from a single image or a directory of images, in name order."""
+
+    realtime = False
+
+    def __init__(self, path, repeat=1):
+        if os.path.isdir(path):
+            names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+            self.paths = [os.path.join(path, n) for n in names]
+        else:
+            self.paths = [path]
+        self.paths = self.paths * max(1, repeat)
+        self._next = 0
+
+    def is_opened(self):
+        return len(self.paths) > 0
+
+    def read(self):
+        while self._next < len(self.paths):
+            frame = cv2.imread(self.paths[self._next])
+            self._next += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def release(self):
+        self._next = len(self.paths)
+
+
+def open_video_source(spec):
+    """Build a video source from a camera index, video file, image or image directory."""
+    if spec is None:
+        return CameraSource(0)
+    if isinstance(spec, int) or str(spec).isdigit():
+        return CameraSource(int(spec))
+    if os.path.isdir(spec) or str(spec).lower().endswith(IMAGE_EXTENSIONS):
+        return ImageSource(spec)
+    return VideoFileSource(spec)
+
+
+class MicrophoneSource:
+    """Live 16-bit mono audio from a PyAudio input stream."""
+
+    realtime = True
+
+    def __init__(self, pa, device_index, rate, chunk, owns_pa=True, name=None):
+        import pyaudio
+
+        self.pa = pa
+        self.owns_pa = owns_pa
+        self.name = name
+        self.buffer_frames = chunk
+        self.rate = rate
+        # frames already waiting in PortAudio at the last read; a growing backlog
+        # means the reader is falling behind (real overflows are not reported
+        # with exception_on_overflow=False)
+        self.backlog_frames = 0
+        metrics.gauge("audio_input_backlog_frames", lambda: self.backlog_frames, source=name)
+        self.stream = pa.open(
+            format=pyaudio.paInt16,
+            rate=rate,
+            channels=1,
+            input=True,
+            input_device_index=device_index,
+            frames_per_buffer=chunk,
+        )
+
+    def read(self, frames):
+        """Return the next block as float32 samples (empty after a read error)."""
+        if metrics.enabled():
+            self.backlog_frames = self.stream.get_read_available()
+        try:
+            data = self.stream.read(frames, exception_on_overflow=False)
+        except IOError:
+            metrics.inc("audio_read_errors", source=self.name)
+            return np.empty(0, dtype=np.float32)
+        return np.frombuffer(data, dtype=np.int16).astype(np.float32)
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        if self.owns_pa:
+            self.pa.terminate()
+
+
+class WavFileSource:
+    """Audio blocks replayed from a 16-bit PCM WAV file (multi-channel files are averaged to mono)."""
+
+    realtime = False
+
+    def __init__(self, path):
+        self.path = path
+        self._wav = wave.open(path, "rb")
+        if self._wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+        self.rate = self._wav.getframerate()
+        self.channels = self._wav.getnchannels()
+
+    def frame_count(self):
+        return self._wav.getnframes()
+
+    def seek(self, frame_index):
+        self._wav.setpos(frame_index)
+
+    def read(self, frames):
+        """Return the next block as float32 samples, or None at end of file."""
+        data = self._wav.readframes(frames)
+        if not data:
+            return None
+        audio = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        if self.channels > 1:
+            audio = audio.reshape(-1, self.channels).mean(axis=1)
+        return audio
+
+    def close(self):
+        self._wav.close()
@@ -7,8 +7,13 @@ import face_recognition
 import cv2
 import numpy as np
 import datetime
+import threading
 import time
 import sys
+from collections import deque
+
+import metrics
+from sources import open_video_source
 print(sys.executable)
 
 def prepare_frame(frame):
@@ -26,17 +31,20 @@ def prepare_frame(frame):
 class VideoRecognizer:
     """Recognizes video input from a camera device."""
 
-    def __init__(self, faces, device_index=None, device_name=None, callback=None):
+    def __init__(self, faces, device_index=None, device_name=None, callback=None, source=None, show=True, source_name=None):
         self.device_index = device_index
         self.device_name = device_name
         self.callback = callback
         self.faces = faces  # Loaded face encodings
+        self.source = source  # camera/file/image source; defaults to the camera at device_index
+        self.show = show
+        self.source_name = source_name  # tag added to detections, e.g. "camera0"
 
     def run(self):
         """Start the video recognition loop."""
-        cap = cv2.VideoCapture(self.device_index if self.device_index is not None else 0)
+        cap = self.source or open_video_source(self.device_index if self.device_index is not None else 0)
 
-        if not cap.isOpened():
+        if not cap.is_opened():
             print("Error: Could not open video device.")
             return
 
@@ -46,78 +54,235 @@ class VideoRecognizer:
         DETECT_EVERY_N_FRAMES = 1  # Change this value as needed
 
         while True:
-            ret, frame = cap.read()
+            with metrics.timer("capture", source=self.source_name):
+                ret, frame = cap.read()
             if not ret:
-                print("Error: Could not read frame.")
+                if cap.realtime:
+                    print("Error: Could not read frame.")
                 break
             frame_count += 1
             # Face recognition and anomaly detection
-            if (frame_count % DETECT_EVERY_N_FRAMES == 0 and self.anomalyDetected(frame)):  # Replace with actual detection logic
+            unknown = self.unknownFaces(frame, source=self.source_name) if frame_count % DETECT_EVERY_N_FRAMES == 0 else []
+            if unknown:
                 detection = {
                     "type": "video",
                     "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
                     "details": "Unknown face detected in video frame.",
+                    "source": self.source_name,
+                    "unknown_encodings": unknown,
                     "frame": frame  # You can process or save the frame as needed
                 }
                 if self.callback:
-                    self.callback(detection)
+                    with metrics.timer("dispatch", source=self.source_name):
+                        self.callback(detection)
 
+            if not self.show:
+                continue
             cv2.imshow('Video Feed', frame)
 
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
 
         cap.release()
-        cv2.destroyAllWindows()
+        if self.show:
+            cv2.destroyAllWindows()
+
+    def identifyFaces(self, frame, source=None):
+        """Find faces in a frame and match them against the known faces.
 
-    def anomalyDetected(self, frame):
+        Returns a list of (name, (top, right, bottom, left), encoding) with
+        boxes in full-frame coordinates; unmatched faces are named "Unknown".
+        """
         # Downsample for faster processing
         DOWNSCALE = 0.25  # 0.5 = half size, adjust as needed
-        small_frame = cv2.resize(frame, (0, 0), fx=DOWNSCALE, fy=DOWNSCALE)
-        rgb_small = prepare_frame(small_frame)
+        with metrics.timer("resize", source=source):
+            small_frame = cv2.resize(frame, (0, 0), fx=DOWNSCALE, fy=DOWNSCALE)
+            rgb_small = prepare_frame(small_frame)
 
-        locations = face_recognition.face_locations(rgb_small)
+        with metrics.timer("detect", source=source):
+            locations = face_recognition.face_locations(rgb_small)
         if not locations or len(locations) == 0:
-            return False
+            return []
 
         try:
-            encodings = face_recognition.face_encodings(rgb_small, locations)
+            with metrics.timer("encode", source=source):
+                encodings = face_recognition.face_encodings(rgb_small, locations)
             if not encodings or len(encodings) != len(locations):
                 print(f"Warning: Got {len(encodings)} encodings for {len(locations)} locations, skipping frame.")
-                return False
+                return []
         except Exception as e:
             print(f"Error in face encoding: {e}")
             print(f"Locations: {locations}")
             print(f"Frame dtype: {rgb_small.dtype}, shape: {rgb_small.shape}")
-            return False
-
-        anomaly = False
-
-        # Scale locations back to original frame size
-        for (top, right, bottom, left), enc in zip(locations, encodings):
-            top = int(top / DOWNSCALE)
-            right = int(right / DOWNSCALE)
-            bottom = int(bottom / DOWNSCALE)
-            left = int(left / DOWNSCALE)
-
-            distances = [np.linalg.norm(enc - k["encoding"]) for k in self.faces]
-            if len(distances) > 0:
-                idx = np.argmin(distances)
-                best_distance = distances[idx]
-            else:
-                best_distance = 999
-
-            if best_distance < 0.75:
-                name = self.faces[idx]["name"]
-            else:
-                name = "Unknown"
-                anomaly = True
+            return []
+
+        matches = []
+        with metrics.timer("match", source=source):
+            # Scale locations back to original frame size
+            for (top, right, bottom, left), enc in zip(locations, encodings):
+                top = int(top / DOWNSCALE)
+                right = int(right / DOWNSCALE)
+                bottom = int(bottom / DOWNSCALE)
+                left = int(left / DOWNSCALE)
+
+                distances = [np.linalg.norm(enc - k["encoding"]) for k in self.faces]
+                if len(distances) > 0:
+                    idx = np.argmin(distances)
+                    best_distance = distances[idx]
+                else:
+                    best_distance = 999
+
+                if best_distance < 0.75:
+                    name = self.faces[idx]["name"]
+                else:
+                    name = "Unknown"
+                matches.append((name, (top, right, bottom, left), enc))
+
+        return matches
+
+    def unknownFaces(self, frame, source=None):
+        """Label faces on the frame and return the encodings of the unknown ones."""
+        unknown = []
+        for name, (top, right, bottom, left), enc in self.identifyFaces(frame, source=source):
+            if name == "Unknown":
+                unknown.append(enc)
 
             cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
             cv2.putText(frame, name, (left, top - 10),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
 
-        return anomaly
+        return unknown
+
+    def anomalyDetected(self, frame, source=None):
+        return len(self.unknownFaces(frame, source=source)) > 0
+
+
+class MultiVideoRecognizer:
+    """Runs one shared VideoRecognizer (model, gallery) over several cameras.
+
+    Each camera has a capture thread that keeps only its latest frame, so the
+    per-camera cost is one frame buffer. A single inference thread visits
+    cameras round-robin, so a busy camera cannot starve the others. There is
+    one inference thread because face_recognition keeps one module-level dlib
+    detector and encoder, which are not safe to share between threads.
+    Frames are displayed only from the thread that called run().
+    """
+
+    def __init__(self, faces, sources, callback=None, show=False):
+        self.recognizer = VideoRecognizer(faces=faces, show=show)
+        self.sources = dict(sources)  # source name -> video source
+        self.callback = callback
+        self.show = show
+        self._display = {}  # source name -> latest annotated frame to show
+        self.frames_dropped = {name: 0 for name in self.sources}
+        self._latest = {name: None for name in self.sources}
+        self._finished = set()
+        self._order = deque(self.sources)
+        self._cond = threading.Condition()
+        self._running = False
+        metrics.gauge("video_frames_pending", self.pending_frames)
+
+    def pending_frames(self):
+        """Cameras with a captured frame waiting for inference."""
+        return sum(frame is not None for frame in self._latest.values())
+
+    def _capture_loop(self, name, source):
+        while self._running:
+            with metrics.timer("capture", source=name):
+                ret, frame = source.read()
+            if not ret:
+                if source.realtime:
+                    print(f"Error: Could not read frame from {name}.")
+                break
+            with self._cond:
+                if self._latest[name] is not None:
+                    self.frames_dropped[name] += 1
+                    metrics.inc("frames_dropped", source=name)
+                self._latest[name] = frame
+                self._cond.notify()
+        source.release()
+        with self._cond:
+            self._finished.add(name)
+            self._cond.notify_all()
+
+    def _next_frame(self):
+        """Take the freshest frame of the next camera in round-robin order."""
+        with self._cond:
+            while self._running:
+                for _ in range(len(self._order)):
+                    name = self._order[0]
+                    self._order.rotate(-1)
+                    frame = self._latest[name]
+                    if frame is not None:
+                        self._latest[name] = None
+                        return name, frame
+                if len(self._finished) == len(self.sources):
+                    return None
+                self._cond.wait(timeout=0.1)
+        return None
+
+    def _inference_loop(self):
+        while True:
+            item = self._next_frame()
+            if item is None:
+                break
+            name, frame = item
+            unknown = self.recognizer.unknownFaces(frame, source=name)
+            if unknown:
+                detection = {
+                    "type": "video",
+                    "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    "details": "Unknown face detected in video frame.",
+                    "source": name,
+                    "unknown_encodings": unknown,
+                    "frame": frame
+                }
+                if self.callback:
+                    with metrics.timer("dispatch", source=name):
+                        self.callback(detection)
+            if self.show:
+                with self._cond:
+                    self._display[name] = frame
+
+    def _show_frames(self):
+        """Show the latest annotated frames; returns False when 'q' is pressed."""
+        with self._cond:
+            frames, self._display = self._display, {}
+        for name, frame in frames.items():
+            cv2.imshow(f'Video Feed ({name})', frame)
+        return cv2.waitKey(30) & 0xFF != ord('q')
+
+    def run(self):
+        """Start capture and inference threads and block until every camera stops."""
+        opened = {name: src for name, src in self.sources.items() if src.is_opened()}
+        for name in set(self.sources) - set(opened):
+            print(f"Error: Could not open video device {name}.")
+            self._finished.add(name)
+        if not opened:
+            return
+
+        print(f"Video recognizer started on {len(opened)} camera(s).")
+        self._running = True
+        threads = [threading.Thread(target=self._capture_loop, args=(name, src), daemon=True)
+                   for name, src in opened.items()]
+        worker = threading.Thread(target=self._inference_loop, daemon=True)
+        for t in threads + [worker]:
+            t.start()
+        try:
+            while worker.is_alive():
+                if not self.show:
+                    worker.join()
+                elif not self._show_frames():
+                    break
+        finally:
+            self.stop()
+            if self.show:
+                cv2.destroyAllWindows()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
 
 
 def _build_arg_parser():
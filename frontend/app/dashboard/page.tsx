@@ -1,11 +1,13 @@
 "use client";
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import DeviceSelector from "@/components/DeviceSelector";
 import { useRouter } from "next/navigation";
 import { useAuth } from "../providers/AuthProvider";
 
 const BACKEND = process.env.NEXT_PUBLIC_BACKEND_URL;
 const DEVICES_API_URL = `${BACKEND}/API/devices/`;
+const EVENTS_PAGE_SIZE = 50;
+const STREAM_RETRY_MS = 3000;
 
 type Event = {
   id: string;
@@ -18,6 +20,10 @@ export default function DashboardPage() {
   const router = useRouter();
   const auth = useAuth();
   const [events, setEvents] = useState<Event[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // newest event seen, tagged with its device so a stream never resumes from another device's id
+  const lastEventId = useRef<{ deviceId: string; id: string } | null>(null);
   const [loading, setLoading] = useState(true);
   const [deviceId, setDeviceId] = useState<string | null>(null);
   const [devices, setDevices] = useState<Array<{ id: string; name: string }>>([]);
@@ -78,21 +84,30 @@ export default function DashboardPage() {
     setDeviceId(firstId);
   }
 
+  async function fetchEventsPage(id: string, cursor?: string | null) {
+    const params = new URLSearchParams({ limit: String(EVENTS_PAGE_SIZE) });
+    if (cursor) params.set("cursor", cursor);
+    const res = await auth.apiFetch(
+      `${DEVICES_API_URL}events/${id}?${params}`,
+      { method: "GET" }
+    );
+    const data = await res.json();
+    if (!res.ok) {
+      throw new Error(data?.error || `Request failed: ${res.status}`);
+    }
+    return { events: (data.events || []) as Event[], nextCursor: (data.next_cursor ?? null) as string | null };
+  }
+
   async function fetchEvents(idParam?: string) {
     const id = idParam ?? deviceId;
     if (!id || !ensureAuth()) return;
     try {
       console.log("Fetching events for device:", id);
       setLoading(true);
-      const res = await auth.apiFetch(
-        `${DEVICES_API_URL}events/${id}`, // use path param instead of query
-        { method: "GET" }
-      );
-      const data = await res.json();
-      if (!res.ok) {
-        throw new Error(data?.error || `Request failed: ${res.status}`);
-      }
-      setEvents(data.events || []);
+      const page = await fetchEventsPage(id);
+      setEvents(page.events);
+      setNextCursor(page.nextCursor);
+      lastEventId.current = page.events[0] ? { deviceId: id, id: page.events[0].id } : null;
       setLoading(false);
     } catch (error) {
       console.error("Error fetching events:", error);
@@ -100,6 +115,20 @@ export default function DashboardPage() {
     }
   }
 
+  async function fetchMoreEvents() {
+    if (!deviceId || !nextCursor || !ensureAuth()) return;
+    try {
+      setLoadingMore(true);
+      const page = await fetchEventsPage(deviceId, nextCursor);
+      setEvents((prev) => [...prev, ...page.events]);
+      setNextCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Error fetching more events:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  }
+
   useEffect(() => {
     if (!ensureAuth()) return;
     setLoading(true);
@@ -113,6 +142,65 @@ export default function DashboardPage() {
   }, [ deviceId, auth.ready, auth.accessToken ]);
 
 
+  // Live updates: append events pushed by the backend instead of re-fetching history
+  useEffect(() => {
+    if (!deviceId || !auth.ready || !auth.accessToken) return;
+    if (lastEventId.current && lastEventId.current.deviceId !== deviceId) lastEventId.current = null;
+    const controller = new AbortController();
+    let retry: ReturnType<typeof setTimeout> | null = null;
+
+    function handleFrame(frame: string) {
+      let type = "message";
+      let data = "";
+      for (const line of frame.split("\n")) {
+        if (line.startsWith("event:")) type = line.slice(6).trim();
+        else if (line.startsWith("data:")) data += line.slice(5).trim();
+      }
+      if (type === "reset") {
+        fetchEvents(deviceId!);
+      } else if (type === "event" && data) {
+        const ev = JSON.parse(data) as Event;
+        lastEventId.current = { deviceId: deviceId!, id: ev.id };
+        setEvents((prev) => (prev.some((e) => e.id === ev.id) ? prev : [ev, ...prev]));
+      }
+    }
+
+    async function connect() {
+      try {
+        // resume via the query parameter: a Last-Event-ID header would need its own CORS allowance
+        const last = lastEventId.current?.deviceId === deviceId ? lastEventId.current.id : null;
+        const query = last ? `?last_event_id=${encodeURIComponent(last)}` : "";
+        const res = await auth.apiFetch(`${DEVICES_API_URL}events/${deviceId}/stream${query}`, {
+          method: "GET",
+          signal: controller.signal,
+        });
+        if (!res.ok || !res.body) throw new Error(`Stream failed: ${res.status}`);
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+          let sep;
+          while ((sep = buffer.indexOf("\n\n")) !== -1) {
+            handleFrame(buffer.slice(0, sep));
+            buffer = buffer.slice(sep + 2);
+          }
+        }
+      } catch (error) {
+        if (controller.signal.aborted) return;
+        console.error("Event stream error:", error);
+      }
+      if (!controller.signal.aborted) retry = setTimeout(connect, STREAM_RETRY_MS);
+    }
+
+    connect();
+    return () => {
+      controller.abort();
+      if (retry) clearTimeout(retry);
+    };
+  }, [ deviceId, auth.ready, auth.accessToken ]);
 
   if (loading)
     return (
@@ -235,6 +323,15 @@ export default function DashboardPage() {
               )}
             </div>
           ))}
+          {nextCursor && (
+            <button
+              onClick={fetchMoreEvents}
+              disabled={loadingMore}
+              className="w-full px-3 py-2 bg-gray-100 rounded hover:bg-gray-200 text-sm disabled:opacity-50"
+            >
+              {loadingMore ? "Loading…" : "Load more"}
+            </button>
+          )}
         </div>
       )}
     </div>